@@ -93,6 +93,25 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+# Кеш должен быть общим для всех процессов uwsgi и для команд manage.py: сброс версии каталога,
+# количества строк и букв фильтров делается в том процессе, где изменились данные.
+# По умолчанию файловый кеш внутри контейнера; при нескольких контейнерах с приложением нужен
+# Redis или кеш в БД. LocMemCache (CACHE_BACKEND=django.core.cache.backends.locmem.LocMemCache)
+# годится только для разработки в одном процессе.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', '/var/tmp/movies_cache'),
+        'OPTIONS': {
+            # Ответы API кешируются по каждому набору параметров, стандартных 300 записей мало
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -136,4 +155,17 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-LOCALE_PATHS = ['movies/locale']
\ No newline at end of file
+LOCALE_PATHS = ['movies/locale']
+
+# Режим подсчёта count в /api/v1/movies/: exact, cached или estimate
+MOVIES_API_COUNT_MODE = os.environ.get('MOVIES_API_COUNT_MODE', 'cached')
+# Сколько секунд хранится закешированный count
+MOVIES_API_COUNT_TIMEOUT = int(os.environ.get('MOVIES_API_COUNT_TIMEOUT', 60))
+# Сколько секунд хранится закешированный ответ API
+MOVIES_API_CACHE_TIMEOUT = int(os.environ.get('MOVIES_API_CACHE_TIMEOUT', 300))
+# До скольких строк список в админке считается точно, а не по статистике планировщика
+MOVIES_ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('MOVIES_ADMIN_EXACT_COUNT_LIMIT', 10000))
+# Сколько секунд хранится список первых букв для фильтров в админке
+MOVIES_ADMIN_FACET_TIMEOUT = int(os.environ.get('MOVIES_ADMIN_FACET_TIMEOUT', 3600))
+# Читать жанры и персоны фильмов в API из сводной таблицы film_work_summary вместо агрегации связей
+MOVIES_API_USE_SUMMARY = os.environ.get('MOVIES_API_USE_SUMMARY', False) == 'True'
@@ -1,44 +1,66 @@
 from django.contrib import admin
+from django.utils.translation import gettext_lazy as _
+from .admin_filters import FilmCountFilter, GenreLetterFilter, PersonLetterFilter, PersonRoleFilter, film_count_annotation
+from .admin_tools import EstimatedCountPaginator, PaginatedInlineMixin, UUIDSearchMixin
 from .models import Genre, Filmwork, GenreFilmwork, PersonFilmwork, Person
 
 
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
+class GenreAdmin(UUIDSearchMixin, admin.ModelAdmin):
     # pass
 
     # Отображение полей в списке
     list_display = ('name',)
 
-    # Фильтрация в списке
-    list_filter = ('name',)
+    # Фильтрация в списке: по первой букве, без SELECT DISTINCT по всем названиям
+    list_filter = (GenreLetterFilter,)
 
-    # Поиск по полям
-    search_fields = ('description', 'id')
+    # Поиск по полям; по нему же работает автодополнение жанра в фильме
+    search_fields = ('name',)
 
-class GenreFilmworkInline(admin.TabularInline):
+class GenreFilmworkInline(PaginatedInlineMixin, admin.TabularInline):
     model = GenreFilmwork
-    raw_id_fields = ('genre',)
+    autocomplete_fields = ('genre',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('genre').order_by('genre__name', 'id')
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(UUIDSearchMixin, admin.ModelAdmin):
     # pass
     # Отображение полей в списке
-    list_display = ('full_name', )
+    list_display = ('full_name', 'film_count')
 
-    # Фильтрация в списке
-    list_filter = ('full_name', )
+    # Фильтрация в списке: первая буква, роль и количество фильмов вместо списка всех имён
+    list_filter = (PersonLetterFilter, PersonRoleFilter, FilmCountFilter)
+
+    # Поиск по полям: по trigram-индексу на UPPER(full_name); на нём же автодополнение персоны в фильме
+    search_fields = ('full_name',)
 
-    # Поиск по полям
-    search_fields = ('full_name', 'id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Сортировка по имени идёт по индексу (full_name, id); id делает страницы автодополнения стабильными
+    ordering = ('full_name', 'id')
 
+    def get_queryset(self, request):
+        # Подзапрос считается только для строк текущей страницы
+        return super().get_queryset(request).annotate(film_count=film_count_annotation())
 
-class PersonFilmworkInline(admin.TabularInline):
+    @admin.display(description=_('film count'))
+    def film_count(self, obj):
+        return obj.film_count
+
+
+class PersonFilmworkInline(PaginatedInlineMixin, admin.TabularInline):
     model = PersonFilmwork
-    raw_id_fields = ('person',)
+    autocomplete_fields = ('person',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('person').order_by('role', 'person__full_name', 'id')
 
 
 @admin.register(Filmwork)
-class FilmworkAdmin(admin.ModelAdmin):
+class FilmworkAdmin(UUIDSearchMixin, admin.ModelAdmin):
     inlines = (GenreFilmworkInline, PersonFilmworkInline) #
 
     # Отображение полей в списке
@@ -47,6 +69,10 @@ class FilmworkAdmin(admin.ModelAdmin):
     # Фильтрация в списке
     list_filter = ('type', 'creation_date')
 
-    # Поиск по полям
-    search_fields = ('title', 'description', 'id')
+    # Поиск по полям: UUID ищется по первичному ключу, текст - по trigram-индексам на UPPER(title/description)
+    search_fields = ('title', 'description')
+
+    # Без COUNT(*) по всей таблице на каждой странице списка
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Exists, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Collate, Upper
+from django.utils.translation import gettext_lazy as _
+
+from movies.models import PersonFilmwork, PersonFilmworkRole
+
+# Первые буквы перебираются по индексу на UPPER(поле) COLLATE "C": каждая следующая буква -
+# это min() по индексу от начала следующей, поэтому запрос делает по одному поиску в индексе на букву
+LETTERS_QUERY = """
+WITH RECURSIVE letters AS (
+    SELECT min(UPPER({field}) COLLATE "C") AS name
+    FROM {table} WHERE {field} <> ''
+  UNION ALL
+    SELECT (
+        SELECT min(UPPER(t.{field}) COLLATE "C")
+        FROM {table} t
+        WHERE t.{field} <> '' AND UPPER(t.{field}) COLLATE "C" >= chr(ascii(letters.name) + 1)
+    )
+    FROM letters WHERE letters.name IS NOT NULL
+)
+SELECT left(name, 1) FROM letters WHERE name IS NOT NULL;
+"""
+
+
+def letters_cache_key(model):
+    return 'movies:admin:letters:{}'.format(model._meta.db_table)
+
+
+def invalidate_letters(model):
+    """Сбрасывает закешированный список первых букв модели."""
+    cache.delete(letters_cache_key(model))
+
+
+def get_letters(model, field):
+    """Первые буквы значений поля, закешированные до изменения таблицы."""
+    key = letters_cache_key(model)
+    letters = cache.get(key)
+    if letters is None:
+        table = connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(LETTERS_QUERY.format(table=table, field=connection.ops.quote_name(field)))
+            letters = [row[0] for row in cursor.fetchall()]
+        cache.set(key, letters, getattr(settings, 'MOVIES_ADMIN_FACET_TIMEOUT', 3600))
+    return letters
+
+
+class FirstLetterFilter(admin.SimpleListFilter):
+    """
+    Фильтр по первой букве вместо списка всех значений поля.
+    Выборка буквы - диапазон [буква, следующая буква) по индексу на UPPER(поле) COLLATE "C".
+    """
+    title = _('first letter')
+    parameter_name = 'letter'
+    field_name = None
+
+    def lookups(self, request, model_admin):
+        return [(letter, letter) for letter in get_letters(model_admin.model, self.field_name)]
+
+    def queryset(self, request, queryset):
+        letter = self.value()
+        if not letter:
+            return queryset
+        name_key = Collate(Upper(self.field_name), 'C')
+        return queryset.alias(name_key=name_key).filter(
+            name_key__gte=letter[0], name_key__lt=chr(ord(letter[0]) + 1))
+
+
+class PersonLetterFilter(FirstLetterFilter):
+    field_name = 'full_name'
+
+
+class GenreLetterFilter(FirstLetterFilter):
+    field_name = 'name'
+
+
+class PersonRoleFilter(admin.SimpleListFilter):
+    """Персоны, у которых есть фильмы в выбранной роли: EXISTS по индексу (person, role)."""
+    title = _('role')
+    parameter_name = 'role'
+
+    def lookups(self, request, model_admin):
+        return PersonFilmworkRole.choices
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        return queryset.filter(Exists(
+            PersonFilmwork.objects.filter(person_id=OuterRef('pk'), role=self.value())))
+
+
+def film_count_annotation():
+    """Количество фильмов персоны подзапросом к person_film_work."""
+    films = (
+        PersonFilmwork.objects
+        .filter(person_id=OuterRef('pk'))
+        .order_by()
+        .values('person_id')
+        .annotate(count=Count('film_work_id', distinct=True))
+        .values('count')
+    )
+    return Coalesce(Subquery(films, output_field=IntegerField()), Value(0))
+
+
+class FilmCountFilter(admin.SimpleListFilter):
+    """Фильтр по количеству фильмов персоны."""
+    title = _('film count')
+    parameter_name = 'films'
+    ranges = {
+        '0': (0, 0),
+        '1-5': (1, 5),
+        '6-20': (6, 20),
+        '21+': (21, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, key) for key in self.ranges]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        low, high = self.ranges[self.value()]
+        if low == 0:
+            # Персоны без фильмов - анти-соединение, без подсчёта
+            return queryset.exclude(Exists(PersonFilmwork.objects.filter(person_id=OuterRef('pk'))))
+        # Количество считается одним сгруппированным проходом по person_film_work,
+        # а не коррелированным подзапросом на каждую персону
+        persons = (
+            PersonFilmwork.objects
+            .order_by()
+            .values('person_id')
+            .annotate(films_total=Count('film_work_id', distinct=True))
+            .filter(films_total__gte=low)
+        )
+        if high is not None:
+            persons = persons.filter(films_total__lte=high)
+        return queryset.filter(pk__in=persons.values('person_id'))
@@ -0,0 +1,158 @@
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import models
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+
+from movies.counts import estimate_count
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор списка в админке: для списка без фильтров и поиска количество берётся
+    из статистики планировщика вместо COUNT(*) по всей таблице.
+    Небольшие таблицы и отфильтрованные списки считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimate_count(self.object_list.model)
+            if estimate and estimate > getattr(settings, 'MOVIES_ADMIN_EXACT_COUNT_LIMIT', 10000):
+                return estimate
+        return super().count
+
+
+class UUIDSearchMixin:
+    """
+    Поиск в админке: строка вида UUID ищется точным совпадением по первичному ключу,
+    остальное - по search_fields, которые должны быть покрыты индексами.
+    Приведение id к тексту для LIKE индекс первичного ключа не использует, поэтому id в search_fields не нужен.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        try:
+            pk = uuid.UUID(search_term.strip())
+        except ValueError:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk=pk), False
+
+
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    """
+    Автодополнение, которое берёт подпись выбранного объекта из уже загруженной связи
+    (select_related в queryset inline), а не отдельным запросом на каждую строку.
+    """
+    preloaded = None
+
+    def optgroups(self, name, value, attr=None):
+        obj = self.preloaded
+        selected = {str(v) for v in value if str(v) not in self.choices.field.empty_values}
+        if obj is None or selected != {str(obj.pk)}:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, obj.pk, self.choices.field.label_from_instance(obj), selected, len(options)))
+        return [(None, options, 0)]
+
+
+class PreloadedRelationForm(forms.ModelForm):
+    """Форма строки inline: передаёт виджетам автодополнения связанные объекты, загруженные вместе со строкой."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            # Админка оборачивает виджет связи в RelatedFieldWidgetWrapper
+            widget = getattr(field.widget, 'widget', field.widget)
+            if isinstance(widget, PreloadedAutocompleteSelect):
+                widget.preloaded = self.instance._state.fields_cache.get(name)
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Inline-формсет, который показывает связи страницами по per_page строк."""
+    per_page = None
+    page = 1
+    page_param = 'page'
+    query = None
+    page_obj = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.per_page and self.page_obj is None:
+            self.page_obj = Paginator(queryset, self.per_page).get_page(self.page)
+            self._queryset = self.page_obj.object_list
+        return self._queryset
+
+    def clean(self):
+        """
+        Проверка уникальности по всем связям фильма, а не только по строкам текущей страницы:
+        новая или изменённая строка не должна совпадать со связью, показанной на другой странице.
+        """
+        super().clean()
+        if not self.per_page or self.instance._state.adding:
+            return
+        # Строки текущей страницы проверены между собой в super().clean() и могут меняться в этом же запросе
+        page_pks = [form.instance.pk for form in self.initial_forms]
+        for constraint in self.model._meta.constraints:
+            if not isinstance(constraint, models.UniqueConstraint) or self.fk.name not in constraint.fields:
+                continue
+            fields = [name for name in constraint.fields if name != self.fk.name]
+            for form in self.forms:
+                # Строка с ошибкой уже не сохранится, в том числе по проверке уникальности самой формы
+                if not form.has_changed() or self._should_delete_form(form) or form.errors:
+                    continue
+                # Значения берутся из экземпляра: поле ограничения может быть исключено из формы
+                values = {
+                    field.attname: getattr(form.instance, field.attname)
+                    for field in map(self.model._meta.get_field, fields)
+                }
+                if None in values.values():
+                    continue
+                duplicates = self.model._default_manager.filter(**{self.fk.name: self.instance}, **values)
+                if duplicates.exclude(pk__in=page_pks).exists():
+                    form.add_error(None, self.get_unique_error_message(fields))
+
+    def page_links(self):
+        """Ссылки на страницы: пары (номер или многоточие, ссылка или None)."""
+        links = []
+        paginator = self.page_obj.paginator
+        for number in paginator.get_elided_page_range(self.page_obj.number):
+            if number == paginator.ELLIPSIS or number == self.page_obj.number:
+                links.append((number, None))
+                continue
+            query = self.query.copy()
+            query[self.page_param] = number
+            links.append((number, '?' + query.urlencode()))
+        return links
+
+
+class PaginatedInlineMixin:
+    """
+    Inline со страницами: у фильма с большим составом страница изменения
+    не рендерит все связи сразу. Номер страницы берётся из параметра {prefix}-page.
+    """
+    formset = PaginatedInlineFormSet
+    form = PreloadedRelationForm
+    per_page = 50
+    template = 'admin/movies/edit_inline/paginated_tabular.html'
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = PreloadedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        page_param = '{}-page'.format(formset.get_default_prefix())
+        return type(formset.__name__, (formset,), {
+            'per_page': self.per_page,
+            'page': request.GET.get(page_param, 1),
+            'page_param': page_param,
+            'query': request.GET,
+        })
@@ -0,0 +1,68 @@
+from django import forms
+from django.db.models import Q
+
+from movies.models import FilmworkType, GenreFilmwork, PersonFilmwork
+
+# id идёт в том же направлении, что и основное поле, чтобы сортировка шла по индексу
+SORT_FIELDS = {
+    'rating': ('rating', 'id'),
+    '-rating': ('-rating', '-id'),
+    'creation_date': ('creation_date', 'id'),
+    '-creation_date': ('-creation_date', '-id'),
+}
+
+
+class MoviesFilterForm(forms.Form):
+    """Параметры фильтрации, сортировки и поиска для списка фильмов."""
+    genre = forms.UUIDField(required=False)
+    person = forms.UUIDField(required=False)
+    type = forms.ChoiceField(required=False, choices=FilmworkType.choices)
+    rating_min = forms.FloatField(required=False)
+    rating_max = forms.FloatField(required=False)
+    creation_date_from = forms.DateField(required=False)
+    creation_date_to = forms.DateField(required=False)
+    query = forms.CharField(required=False, strip=True)
+    sort = forms.ChoiceField(required=False, choices=[(key, key) for key in SORT_FIELDS])
+
+    def has_filters(self):
+        """Есть ли в запросе условия, сужающие выборку."""
+        return any(
+            value not in (None, '')
+            for name, value in self.cleaned_data.items()
+            if name != 'sort'
+        )
+
+    def filter_queryset(self, queryset):
+        """
+        Накладывает фильтры на queryset фильмов.
+        Фильтры по жанру и персоне сделаны подзапросами, чтобы не сужать
+        агрегированные списки жанров и персон в ответе.
+        """
+        data = self.cleaned_data
+        if data['genre']:
+            queryset = queryset.filter(
+                id__in=GenreFilmwork.objects.filter(genre_id=data['genre']).values('film_work_id'))
+        if data['person']:
+            queryset = queryset.filter(
+                id__in=PersonFilmwork.objects.filter(person_id=data['person']).values('film_work_id'))
+        if data['type']:
+            queryset = queryset.filter(type=data['type'])
+        if data['rating_min'] is not None:
+            queryset = queryset.filter(rating__gte=data['rating_min'])
+        if data['rating_max'] is not None:
+            queryset = queryset.filter(rating__lte=data['rating_max'])
+        if data['creation_date_from']:
+            queryset = queryset.filter(creation_date__gte=data['creation_date_from'])
+        if data['creation_date_to']:
+            queryset = queryset.filter(creation_date__lte=data['creation_date_to'])
+        if data['query']:
+            # Поиск по вхождению, ускоряется trigram-индексами на UPPER(title) и UPPER(description)
+            queryset = queryset.filter(
+                Q(title__icontains=data['query']) | Q(description__icontains=data['query']))
+        return queryset
+
+    def get_ordering(self):
+        """Сортировка из параметра sort; id добавляется для стабильного порядка страниц."""
+        if self.cleaned_data['sort']:
+            return SORT_FIELDS[self.cleaned_data['sort']]
+        return 'id',
@@ -0,0 +1,91 @@
+import base64
+import binascii
+import json
+import uuid
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось разобрать."""
+
+
+def encode_cursor(modified, pk):
+    """Упаковывает пару (modified, id) в непрозрачную строку."""
+    raw = json.dumps([modified.isoformat(), str(pk)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор, полученный от клиента, обратно в (modified, id)."""
+    try:
+        modified, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # uuid.UUID и parse_datetime на значениях других типов JSON падают не только с ValueError
+        if not isinstance(modified, str) or not isinstance(pk, str):
+            raise InvalidCursor(cursor)
+        modified = parse_datetime(modified)
+        pk = uuid.UUID(pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if modified is None:
+        raise InvalidCursor(cursor)
+    return modified, pk
+
+
+class CursorPaginator:
+    """
+    Keyset-пагинация по паре (modified, id).
+
+    Вместо OFFSET и COUNT(*) выбирается следующая порция строк после последней
+    увиденной записи, поэтому время ответа не зависит от глубины страницы.
+    """
+
+    ordering = ('modified', 'id')
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset.order_by(*self.ordering)
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        """
+        Возвращает записи страницы и курсор следующей страницы.
+
+        :param cursor: курсор из предыдущего ответа или None для первой страницы
+        :return: (список записей, курсор или None)
+        """
+        queryset = self.queryset
+        if cursor:
+            modified, pk = decode_cursor(cursor)
+            # Условие по modified >= позволяет использовать индекс,
+            # остальное отсекает уже выданные строки с тем же modified
+            queryset = queryset.filter(
+                Q(modified__gte=modified),
+                Q(modified__gt=modified) | Q(id__gt=pk),
+            )
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = encode_cursor(rows[-1]['modified'], rows[-1]['id']) if has_next else None
+        return rows, next_cursor
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator, которому общее количество объектов передаётся извне.
+
+    :param count_func: функция без аргументов, возвращающая количество объектов.
+    Если не задана, считается COUNT(*) по object_list.
+    """
+
+    def __init__(self, object_list, per_page, count_func=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_func = count_func
+
+    @cached_property
+    def count(self):
+        if self.count_func is None:
+            return super().count
+        return self.count_func()
@@ -1,11 +1,23 @@
-from django.http import HttpResponse
+import json
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.utils.http import parse_etags, quote_etag
 from django.views import View
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, Q
 from django.views.generic.detail import BaseDetailView
 from django.http import JsonResponse
 from django.views.generic.list import BaseListView
 
+from movies.cache import get_cached_response, response_cache_key, set_cached_response
+from movies.api.v1.filters import MoviesFilterForm
+from movies.api.v1.pagination import CountedPaginator, CursorPaginator, InvalidCursor
+from movies.counts import get_count, get_count_mode
 from movies.models import Filmwork, PersonFilmworkRole
 
 def api(request):
@@ -15,45 +27,153 @@ class MoviesApiMixin:
     model = Filmwork
     http_method_names = ['get']  # Список методов, которые реализует обработчик
 
+    @staticmethod
+    def _aggregate_person(role):
+        # Имена персон с нужной ролью собираются в массив прямо в БД
+        return ArrayAgg('personfilmwork__person__full_name', distinct=True,
+                        filter=Q(personfilmwork__role=role))
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def get_ordering(self):
+        return 'id',
+
+    @staticmethod
+    def use_summary():
+        return getattr(settings, 'MOVIES_API_USE_SUMMARY', False)
+
     def get_queryset(self, **kwargs):
-        all_films = self.model.objects.prefetch_related('genres', 'persons')
-        # print(connection.queries)
+        # Один запрос на страницу: жанры и персоны агрегируются в массивы
+        films = self.filter_queryset(self.model.objects.all())
+        if self.use_summary():
+            # Массивы уже собраны триггерами в film_work_summary: без соединения с таблицами связей и GROUP BY
+            return films.values(
+                'id', 'title', 'description', 'creation_date', 'rating', 'type', 'modified'
+            ).annotate(
+                genres=F('summary__genres'),
+                actors=F('summary__actors'),
+                directors=F('summary__directors'),
+                writers=F('summary__writers'),
+            ).order_by(*self.get_ordering())
+        all_films = films.values(
+            'id', 'title', 'description', 'creation_date', 'rating', 'type', 'modified'
+        ).annotate(
+            genres=ArrayAgg('genres__name', distinct=True, filter=Q(genres__isnull=False)),
+            actors=self._aggregate_person(PersonFilmworkRole.ACTOR),
+            directors=self._aggregate_person(PersonFilmworkRole.DIRECTOR),
+            writers=self._aggregate_person(PersonFilmworkRole.SCENARIST),
+        ).order_by(*self.get_ordering())
         return all_films
 
+    @staticmethod
+    def serialize_film(film):
+        item = dict(film)
+        # modified нужен только для курсора и в ответ не попадает
+        item.pop('modified', None)
+        item['rating'] = float(film['rating']) if film['rating'] else None
+        return item
+
+    def get(self, request, *args, **kwargs):
+        # Готовые ответы хранятся в кеше до изменения каталога
+        key = response_cache_key(request.path, request.GET)
+        cached = get_cached_response(key)
+        if cached is None:
+            try:
+                response = super().get(request, *args, **kwargs)
+            except BadRequest as e:
+                return self.bad_request(e)
+            if response.status_code != 200:
+                return response
+            cached = set_cached_response(key, response.content)
+        etag, content = cached
+
+        if quote_etag(etag) in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = quote_etag(etag)
+        return response
+
+    @staticmethod
+    def bad_request(error):
+        """
+        Ответ 400 в JSON вместо HTML-страницы Django.
+        Ошибки в формате Form.errors.get_json_data(): {поле: [{"message", "code"}]}.
+        """
+        errors = error.args[0] if error.args else 'Bad request'
+        if not isinstance(errors, dict):
+            errors = {'__all__': [{'message': str(errors), 'code': 'invalid'}]}
+        return JsonResponse({'errors': errors}, status=400)
+
     def render_to_response(self, context, **response_kwargs):
         return JsonResponse(context)
 
-class MoviesListApi(BaseListView, MoviesApiMixin):
+class MoviesListApi(MoviesApiMixin, BaseListView):
     model = Filmwork
     http_method_names = ['get']  # Список методов, которые реализует обработчик
     paginate_by = 50
+    paginator_class = CountedPaginator
+
+    @cached_property
+    def filter_form(self):
+        form = MoviesFilterForm(self.request.GET)
+        if not form.is_valid():
+            raise BadRequest(form.errors.get_json_data())
+        return form
+
+    def filter_queryset(self, queryset):
+        return self.filter_form.filter_queryset(queryset)
+
+    def get_ordering(self):
+        return self.filter_form.get_ordering()
+
+    def get_count_func(self):
+        if self.filter_form.has_filters():
+            # Для отфильтрованной выборки считаем точно, но без агрегатов по жанрам и персонам
+            return self.filter_queryset(self.model.objects.all()).count
+        # Режим подсчёта можно выбрать параметром ?count=exact|cached|estimate
+        mode = get_count_mode(self.request.GET.get('count'))
+        return lambda: get_count(self.model, mode)
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(
+            queryset,
+            per_page,
+            count_func=self.get_count_func(),
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            **kwargs)
+
+    def use_cursor_pagination(self):
+        # Курсорный режим включается явно, либо переданным курсором
+        return self.request.GET.get('pagination') == 'cursor' or 'cursor' in self.request.GET
+
+    def get_cursor_context_data(self, queryset):
+        # Курсор задаёт порядок (modified, id), другой сортировки в этом режиме быть не может
+        if self.filter_form.cleaned_data['sort']:
+            raise BadRequest('sort is not supported with cursor pagination')
+        paginator = CursorPaginator(queryset, self.paginate_by)
+        try:
+            films, next_cursor = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise BadRequest('Invalid cursor')
+
+        return {
+            'next': next_cursor,
+            'results': [self.serialize_film(film) for film in films],
+        }
+
     def get_context_data(self, *, object_list=None, **kwargs):
-        queryset = MoviesApiMixin.get_queryset(self)
-        results = list()
+        queryset = object_list if object_list is not None else self.object_list
+        if self.use_cursor_pagination():
+            return self.get_cursor_context_data(queryset)
 
         paginator, page, queryset, is_paginated = self.paginate_queryset(
             queryset,
             self.paginate_by)
 
-        for i in range(0, len(queryset)):
-            genres = queryset[i].genres.all()
-            persons = queryset[i].persons.all()
-
-            item = dict()
-            item['id'] = queryset[i].id
-            item['title'] = queryset[i].title
-            item['description'] = queryset[i].description
-            item['creation_date'] = queryset[i].creation_date
-            item['rating'] = float(queryset[i].rating) if queryset[i].rating else None
-            item['type'] = queryset[i].type
-            item['genres'] = [genre.name for genre in genres]
-            item['actors'] = [person.full_name for person in
-                              persons.filter(personfilmwork__role=PersonFilmworkRole.ACTOR)]
-            item['directors'] = [person.full_name for person in
-                                 persons.filter(personfilmwork__role=PersonFilmworkRole.DIRECTOR)]
-            item['writers'] = [person.full_name for person in
-                               persons.filter(personfilmwork__role=PersonFilmworkRole.SCENARIST)]
-            results.append(item)
+        results = [self.serialize_film(film) for film in queryset]
 
         context = {
             'count': paginator.count,
@@ -70,25 +190,23 @@ class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
     http_method_names = ['get']
 
     def get_context_data(self, *, object_list=None, **kwargs):
-        queryset = MoviesApiMixin.get_queryset(self)
-        obj = BaseDetailView.get_object(self, queryset)
-        genres = obj.genres.all()
-        persons = obj.persons.all()
-
-        item = dict()
-        item['id'] = obj.id
-        item['title'] = obj.title
-        item['description'] = obj.description
-        item['creation_date'] = obj.creation_date
-        item['rating'] = float(obj.rating) if obj.rating else None
-        item['type'] = obj.type
-        item['genres'] = [genre.name for genre in genres]
-        item['actors'] = [person.full_name for person in
-                              persons.filter(personfilmwork__role=PersonFilmworkRole.ACTOR)]
-        item['directors'] = [person.full_name for person in
-                                 persons.filter(personfilmwork__role=PersonFilmworkRole.DIRECTOR)]
-        item['writers'] = [person.full_name for person in
-                               persons.filter(personfilmwork__role=PersonFilmworkRole.SCENARIST)]
-        context = item
+        return self.serialize_film(self.object)
 
-        return context
+class MoviesExportApi(MoviesApiMixin, View):
+    model = Filmwork
+    http_method_names = ['get']
+    chunk_size = 2000  # Сколько строк за раз читается из серверного курсора
+
+    def iter_lines(self):
+        # iterator() читает через серверный курсор, поэтому в памяти только одна порция.
+        # Внутри транзакции курсор объявляется без WITH HOLD: в autocommit Postgres
+        # материализовал бы весь каталог до отдачи первой строки
+        with transaction.atomic():
+            for film in self.get_queryset().iterator(chunk_size=self.chunk_size):
+                yield json.dumps(self.serialize_film(film), cls=DjangoJSONEncoder) + '\n'
+
+    def get(self, request, *args, **kwargs):
+        # Весь каталог отдаётся построчно в формате NDJSON, без кеширования.
+        # Выгрузка ограничена отдельным harakiri для этого пути в uwsgi.ini (30 минут),
+        # nginx ждёт ответа столько же (configs/site.conf)
+        return StreamingHttpResponse(self.iter_lines(), content_type='application/x-ndjson')
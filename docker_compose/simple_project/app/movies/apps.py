@@ -6,6 +6,5 @@ class MoviesConfig(AppConfig):
     name = 'movies'
     verbose_name = _('movies')
 
-class AppsConfig(AppConfig):
     def ready(self):
         import movies.signals
\ No newline at end of file
@@ -0,0 +1,302 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.db import connection, models, transaction
+
+from movies.models import Filmwork, Genre, GenreFilmwork, Person, PersonFilmwork
+
+# Порядок загрузки: сначала сущности, потом связи, которые на них ссылаются
+IMPORT_MODELS = {
+    'genres': Genre,
+    'persons': Person,
+    'films': Filmwork,
+    'genre_film_work': GenreFilmwork,
+    'person_film_work': PersonFilmwork,
+}
+
+FORMATS = ('csv', 'ndjson')
+
+# Транзакции загрузки не отправляют построчные уведомления ETL (см. миграцию 0009_skip_notify_setting):
+# вместо них каждая пачка отправляет в тот же канал несколько уведомлений со списками id
+SKIP_NOTIFY = "SET LOCAL movies.skip_notify = 'on'"
+NOTIFY_CHANNEL = 'content_changes'
+# Сколько id в одном уведомлении: payload pg_notify ограничен 8000 байтами
+NOTIFY_CHUNK = 100
+
+# Экранирование значений для текстового формата COPY
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def get_format(path, requested=None):
+    """Формат файла: явно заданный или по расширению (.csv, остальное - NDJSON)."""
+    if requested:
+        return requested
+    return 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'ndjson'
+
+
+def read_rows(path, file_format):
+    """
+    Читает записи файла.
+    :return: (колонки из заголовка CSV или ключей первой записи NDJSON, итератор списков значений)
+    """
+    source = open(path, encoding='utf-8', newline='')
+    if file_format == 'csv':
+        reader = csv.reader(source)
+        columns = next(reader, [])
+
+        def rows():
+            with source:
+                for row in reader:
+                    # Пустое поле CSV считается NULL
+                    yield [value if value != '' else None for value in row]
+        return columns, rows()
+
+    lines = (line for line in source if line.strip())
+    first = next(lines, None)
+    if first is None:
+        source.close()
+        return [], iter(())
+    first = json.loads(first)
+    columns = list(first)
+
+    def rows():
+        with source:
+            yield [first.get(column) for column in columns]
+            for line in lines:
+                record = json.loads(line)
+                yield [record.get(column) for column in columns]
+    return columns, rows()
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value).translate(COPY_ESCAPES)
+
+
+def copy_batches(rows, size):
+    """Разбивает записи на пачки в текстовом формате COPY: (буфер, количество строк)."""
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write('\t'.join(map(copy_value, row)))
+        buffer.write('\n')
+        count += 1
+        if count == size:
+            buffer.seek(0)
+            yield buffer, count
+            buffer = io.StringIO()
+            count = 0
+    if count:
+        buffer.seek(0)
+        yield buffer, count
+
+
+class TableImport:
+    """
+    Загрузка одной таблицы: COPY пачки во временную таблицу и один INSERT ... ON CONFLICT из неё.
+
+    Строки сущностей обновляются только при изменении загружаемых колонок, поэтому повторная
+    загрузка того же файла не трогает modified и не вызывает переиндексацию. Для новых связей
+    обновляется modified фильма, чтобы ETL переиндексировал его так же, как после правки в админке.
+    Связи с несуществующими фильмами, персонами или жанрами пропускаются.
+
+    :param model: модель таблицы
+    :param columns: колонки входного файла
+    """
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.fields = {field.column: field for field in model._meta.concrete_fields}
+        unknown = set(columns) - set(self.fields)
+        if unknown:
+            raise ValueError('{}: unknown columns {}'.format(
+                model._meta.db_table, ', '.join(sorted(unknown))))
+        self.columns = columns
+        self.key = self.get_key()
+        missing = set(self.key) - set(columns)
+        if missing:
+            raise ValueError('{}: missing columns {}'.format(
+                model._meta.db_table, ', '.join(sorted(missing))))
+        self.table = connection.ops.quote_name(model._meta.db_table)
+        self.staging = connection.ops.quote_name('import_{}'.format(model._meta.db_table.split('"')[-1]))
+        self.relations = [field for field in model._meta.concrete_fields if field.is_relation]
+        # Колонки, по которым ETL находит затронутые документы: ключи связи или id сущности
+        self.notify_columns = [field.column for field in self.relations] or [model._meta.pk.column]
+
+    def get_key(self):
+        """Колонки, по которым запись находит существующую строку: уникальное ограничение связи или id."""
+        for constraint in self.model._meta.constraints:
+            if isinstance(constraint, models.UniqueConstraint):
+                return [self.model._meta.get_field(name).column for name in constraint.fields]
+        return [self.model._meta.pk.column]
+
+    def create_staging(self, cursor):
+        """Временная таблица с колонками входного файла и их типами из основной таблицы."""
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(self.staging))
+        cursor.execute(
+            'CREATE TEMP TABLE {staging} AS '
+            'SELECT {columns} FROM {table} WITH NO DATA'.format(
+                staging=self.staging, table=self.table,
+                columns=', '.join(map(connection.ops.quote_name, self.columns))))
+        # Номер строки во входном файле: из повторов ключа в пачке побеждает последняя
+        cursor.execute('ALTER TABLE {} ADD COLUMN import_row bigserial'.format(self.staging))
+
+    def value_sql(self, column, params):
+        """Выражение колонки: значение из файла или значение по умолчанию, как при сохранении модели."""
+        field = self.fields[column]
+        quoted = 's.{}'.format(connection.ops.quote_name(column))
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            default = 'now()'
+        elif field.primary_key:
+            default = 'gen_random_uuid()'
+        elif field.has_default() and not callable(field.default):
+            params.append(field.default)
+            default = '%s'
+        elif not field.null and field.empty_strings_allowed:
+            default = "''"
+        else:
+            return quoted if column in self.columns else 'NULL'
+        if column not in self.columns:
+            return default
+        return 'COALESCE({}, {})'.format(quoted, default)
+
+    def upsert_sql(self):
+        params = []
+        columns = list(self.fields)
+        values = [self.value_sql(column, params) for column in columns]
+        key = ', '.join(map(connection.ops.quote_name, self.key))
+        joins = ''.join(
+            ' JOIN {table} ON {table}.{pk} = s.{column}'.format(
+                table=connection.ops.quote_name(field.related_model._meta.db_table),
+                pk=connection.ops.quote_name(field.target_field.column),
+                column=connection.ops.quote_name(field.column))
+            for field in self.relations
+        )
+        select = 'SELECT DISTINCT ON ({key}) {values} FROM {staging} s{joins} ORDER BY {key}, s.import_row DESC'.format(
+            key=', '.join('s.{}'.format(connection.ops.quote_name(column)) for column in self.key),
+            values=', '.join(values), staging=self.staging, joins=joins)
+        insert = 'INSERT INTO {table} AS t ({columns}) {select} ON CONFLICT ({key})'.format(
+            table=self.table, columns=', '.join(map(connection.ops.quote_name, columns)), select=select, key=key)
+
+        updated = [
+            column for column in self.columns
+            if column not in self.key and not getattr(self.fields[column], 'auto_now', False)
+            and not getattr(self.fields[column], 'auto_now_add', False)
+        ]
+        returning = ', '.join('t.{}'.format(connection.ops.quote_name(column)) for column in self.notify_columns)
+        if self.relations:
+            # Связь не содержит данных кроме ключа: новые связи помечают фильм изменённым
+            film = self.model._meta.get_field('film_work')
+            sql = (
+                'WITH inserted AS ({insert} DO NOTHING RETURNING {returning}), '
+                'touched AS (UPDATE {film_table} SET modified = now() '
+                'WHERE id IN (SELECT film_work_id FROM inserted)) '
+                'SELECT * FROM inserted'
+            ).format(insert=insert, returning=returning,
+                     film_table=connection.ops.quote_name(film.related_model._meta.db_table))
+        elif updated:
+            modified = [field.column for field in self.model._meta.concrete_fields
+                        if getattr(field, 'auto_now', False)]
+            sql = (
+                '{insert} DO UPDATE SET {assignments} '
+                'WHERE ({current}) IS DISTINCT FROM ({excluded}) RETURNING {returning}'
+            ).format(
+                insert=insert, returning=returning,
+                assignments=', '.join(
+                    '{0} = EXCLUDED.{0}'.format(connection.ops.quote_name(column))
+                    for column in updated + modified),
+                current=', '.join('t.{}'.format(connection.ops.quote_name(column)) for column in updated),
+                excluded=', '.join('EXCLUDED.{}'.format(connection.ops.quote_name(column)) for column in updated),
+            )
+        else:
+            sql = '{insert} DO NOTHING RETURNING {returning}'.format(insert=insert, returning=returning)
+        return sql, params
+
+    def notify(self, cursor, rows):
+        """
+        Уведомляет ETL о записанных строках пачки: по уведомлению на NOTIFY_CHUNK id каждой колонки
+        notify_columns, все одним запросом. Уведомления уходят при фиксации транзакции пачки.
+        """
+        table = self.model._meta.db_table.split('"')[-1]
+        payloads = []
+        for position, column in enumerate(self.notify_columns):
+            ids = sorted({str(row[position]) for row in rows})
+            for start in range(0, len(ids), NOTIFY_CHUNK):
+                payloads.append(json.dumps({
+                    'table': table, 'op': 'IMPORT', column + 's': ids[start:start + NOTIFY_CHUNK]}))
+        if payloads:
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                           [NOTIFY_CHANNEL, payloads])
+
+    def load(self, cursor, buffer):
+        """
+        Загружает пачку в текущей транзакции.
+        :return: количество вставленных или изменённых строк
+        """
+        # copy_expert вызывается у курсора psycopg2 напрямую, ошибки приводятся к исключениям Django
+        with connection.wrap_database_errors:
+            cursor.copy_expert('COPY {} ({}) FROM STDIN'.format(
+                self.staging, ', '.join(map(connection.ops.quote_name, self.columns))), buffer)
+        sql, params = self.upsert_sql()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        self.notify(cursor, rows)
+        return len(rows)
+
+
+class ImportStats:
+    """Счётчики загрузки одной таблицы."""
+
+    def __init__(self, name):
+        self.name = name
+        self.read = 0
+        self.written = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return '{}: read {}, written {}, {:.1f}s, {:.0f} rows/s'.format(
+            self.name, self.read, self.written, self.elapsed, self.rate)
+
+
+def import_table(name, path, file_format=None, batch_size=50000, progress=None):
+    """
+    Загружает файл в таблицу пачками по batch_size строк, каждая пачка - отдельная транзакция
+    (или точка сохранения, если загрузка идёт внутри внешней транзакции).
+    Вместо построчных уведомлений триггера каждая пачка отправляет ETL свои id несколькими уведомлениями,
+    поэтому загруженное индексируется, даже если отметка по modified уже ушла дальше now() пачки.
+    :param name: ключ IMPORT_MODELS
+    :param progress: вызывается с ImportStats после каждой пачки
+    :return: ImportStats
+    """
+    columns, rows = read_rows(path, get_format(path, file_format))
+    table = TableImport(IMPORT_MODELS[name], columns)
+    stats = ImportStats(name)
+    with connection.cursor() as cursor:
+        table.create_staging(cursor)
+        for buffer, count in copy_batches(rows, batch_size):
+            with transaction.atomic():
+                cursor.execute(SKIP_NOTIFY)
+                written = table.load(cursor, buffer)
+                cursor.execute('TRUNCATE {}'.format(table.staging))
+            stats.read += count
+            stats.written += written
+            if progress:
+                progress(stats)
+        if stats.written:
+            # Следующие таблицы и триггеры сводки планируются по статистике, а не по размеру до загрузки
+            cursor.execute('ANALYZE {}'.format(table.table))
+    return stats
@@ -0,0 +1,58 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'movies:api:version'
+
+
+def get_catalog_version():
+    """Текущая версия каталога. Меняется при любом изменении фильмов, персон или жанров."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add не перезапишет версию, если её уже успел выставить другой поток
+        cache.add(CATALOG_VERSION_KEY, version, None)
+        version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def invalidate_catalog():
+    """
+    Делает недоступными все закешированные ответы API.
+    Другие процессы увидят новую версию, только если кеш общий (см. CACHES в настройках).
+    """
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def response_cache_key(path, query_params):
+    """
+    Ключ кеша ответа: версия каталога, эндпоинт и параметры запроса (страница, фильтры).
+
+    :param path: путь запроса
+    :param query_params: QueryDict с параметрами запроса
+    """
+    params = '&'.join(
+        '{}={}'.format(name, value)
+        for name in sorted(query_params)
+        for value in query_params.getlist(name)
+    )
+    digest = hashlib.md5('{}?{}'.format(path, params).encode()).hexdigest()
+    return 'movies:api:{}:{}'.format(get_catalog_version(), digest)
+
+
+def get_cached_response(key):
+    """Возвращает (etag, content) или None."""
+    return cache.get(key)
+
+
+def set_cached_response(key, content):
+    """
+    Сохраняет тело ответа вместе с его ETag.
+
+    :return: (etag, content)
+    """
+    entry = (hashlib.md5(content).hexdigest(), content)
+    cache.set(key, entry, getattr(settings, 'MOVIES_API_CACHE_TIMEOUT', 300))
+    return entry
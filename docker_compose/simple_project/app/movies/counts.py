@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATE = 'estimate'
+COUNT_MODES = (COUNT_EXACT, COUNT_CACHED, COUNT_ESTIMATE)
+
+
+def get_count_mode(requested=None):
+    """Режим подсчёта: из запроса, если он корректен, иначе из настроек."""
+    if requested in COUNT_MODES:
+        return requested
+    return getattr(settings, 'MOVIES_API_COUNT_MODE', COUNT_CACHED)
+
+
+def count_cache_key(model):
+    return 'movies:count:{}'.format(model._meta.db_table)
+
+
+def invalidate_count(model):
+    """Сбрасывает закешированное количество строк модели."""
+    cache.delete(count_cache_key(model))
+
+
+def estimate_count(model):
+    """
+    Оценка количества строк по статистике планировщика (pg_class.reltuples).
+    Если таблица ещё не анализировалась, возвращает None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+            [model._meta.db_table.replace('"', '')],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+def cached_count(model):
+    """Точное количество строк, закешированное до изменения таблицы."""
+    key = count_cache_key(model)
+    count = cache.get(key)
+    if count is None:
+        count = model.objects.count()
+        cache.set(key, count, getattr(settings, 'MOVIES_API_COUNT_TIMEOUT', 60))
+    return count
+
+
+def get_count(model, mode):
+    """
+    Количество строк модели в выбранном режиме.
+
+    :param model: модель, строки которой считаем
+    :param mode: exact, cached или estimate
+    :return: количество строк
+    """
+    if mode == COUNT_ESTIMATE:
+        estimate = estimate_count(model)
+        if estimate:
+            return estimate
+        return cached_count(model)
+    if mode == COUNT_CACHED:
+        return cached_count(model)
+    return model.objects.count()
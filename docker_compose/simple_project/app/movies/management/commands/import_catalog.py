@@ -0,0 +1,69 @@
+import contextlib
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError, IntegrityError, transaction
+
+from movies.admin_filters import invalidate_letters
+from movies.bulk_import import FORMATS, IMPORT_MODELS, ImportStats, import_table
+from movies.cache import invalidate_catalog
+from movies.counts import invalidate_count
+from movies.models import Filmwork, Genre, Person
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка каталога из CSV/NDJSON через COPY во временные таблицы и INSERT ... ON CONFLICT. '
+        'Колонки файла - имена колонок таблицы (id, title, film_work_id, ...). '
+        'Сигналы моделей не вызываются: кеши API и админки сбрасываются один раз в конце '
+        '(нужен общий с uwsgi CACHE_BACKEND). Вместо построчных уведомлений ETL каждая пачка '
+        'отправляет списки своих id.'
+    )
+
+    def add_arguments(self, parser):
+        for name in IMPORT_MODELS:
+            parser.add_argument('--{}'.format(name.replace('_', '-')), dest=name, metavar='PATH',
+                                help='файл для таблицы {}'.format(IMPORT_MODELS[name]._meta.db_table))
+        parser.add_argument('--format', choices=FORMATS,
+                            help='формат файлов (по умолчанию по расширению: .csv или NDJSON)')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='строк в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='загрузить всё в одной транзакции и откатить её')
+
+    def handle(self, *args, **options):
+        files = [(name, options[name]) for name in IMPORT_MODELS if options[name]]
+        if not files:
+            raise CommandError('Nothing to import: pass at least one of --{}'.format(
+                ', --'.join(name.replace('_', '-') for name in IMPORT_MODELS)))
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        total = ImportStats('total')
+        # При пробном запуске пачки становятся точками сохранения внутри одной транзакции
+        outer = transaction.atomic() if options['dry_run'] else contextlib.nullcontext()
+        with outer:
+            for name, path in files:
+                try:
+                    stats = import_table(name, path, options['format'], options['batch_size'],
+                                         progress=self.report if options['verbosity'] > 1 else None)
+                except (OSError, ValueError, DataError, IntegrityError) as e:
+                    raise CommandError(e)
+                self.stdout.write(str(stats))
+                total.read += stats.read
+                total.written += stats.written
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(str(total)))
+        if options['dry_run']:
+            self.stdout.write('Dry run: changes rolled back')
+            return
+        # То, что при сохранении через модели делают сигналы. Команда работает в своём процессе,
+        # поэтому сброс дойдёт до uwsgi только через общий CACHE_BACKEND (см. CACHES в settings)
+        invalidate_catalog()
+        invalidate_count(Filmwork)
+        invalidate_letters(Person)
+        invalidate_letters(Genre)
+
+    def report(self, stats):
+        self.stdout.write('  {}'.format(stats))
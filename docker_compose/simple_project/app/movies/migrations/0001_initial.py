@@ -0,0 +1,105 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:04
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+# Таблицы в схеме content уже есть в базах, созданных из SQL-дампа. Для таких баз эту миграцию
+# нужно отметить выполненной: manage.py migrate movies 0001 --fake.
+# --fake-initial не подходит: имена вида content"."film_work не совпадают с именами таблиц
+# при интроспекции, Django выполнит CREATE TABLE и миграция упадёт.
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Filmwork',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type', models.TextField(choices=[('movie', 'movie'), ('tv_show', 'tv_show')], default='movie', max_length=7, verbose_name='type')),
+                ('title', models.TextField(blank=True, verbose_name='title')),
+                ('creation_date', models.DateField(verbose_name='creation_date')),
+                ('rating', models.FloatField(blank=True, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)], verbose_name='rating')),
+                ('certificate', models.CharField(blank=True, max_length=512, verbose_name='certificate')),
+                ('file_path', models.FileField(blank=True, null=True, upload_to='movies/', verbose_name='file')),
+                ('description', models.TextField(blank=True, verbose_name='description')),
+            ],
+            options={
+                'verbose_name': 'Кинопроизведение',
+                'verbose_name_plural': 'Кинопроизведения',
+                'db_table': 'content"."film_work',
+            },
+        ),
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('description', models.TextField(blank=True, verbose_name='description')),
+            ],
+            options={
+                'verbose_name': 'Жанр',
+                'verbose_name_plural': 'Жанры',
+                'db_table': 'content"."genre',
+            },
+        ),
+        migrations.CreateModel(
+            name='Person',
+            fields=[
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('full_name', models.TextField(blank=True, verbose_name='full_name')),
+            ],
+            options={
+                'verbose_name': 'Персона',
+                'verbose_name_plural': 'Персоны',
+                'db_table': 'content"."person',
+            },
+        ),
+        migrations.CreateModel(
+            name='PersonFilmwork',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('role', models.TextField(choices=[('actor', 'actor'), ('director', 'director'), ('scenarist', 'scenarist')], default='actor', max_length=9, verbose_name='role')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('film_work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.filmwork')),
+                ('person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.person')),
+            ],
+            options={
+                'db_table': 'content"."person_film_work',
+            },
+        ),
+        migrations.CreateModel(
+            name='GenreFilmwork',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('film_work', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.filmwork')),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.genre')),
+            ],
+            options={
+                'db_table': 'content"."genre_film_work',
+            },
+        ),
+        migrations.AddField(
+            model_name='filmwork',
+            name='genres',
+            field=models.ManyToManyField(through='movies.GenreFilmwork', to='movies.genre'),
+        ),
+        migrations.AddField(
+            model_name='filmwork',
+            name='persons',
+            field=models.ManyToManyField(through='movies.PersonFilmwork', to='movies.person'),
+        ),
+    ]
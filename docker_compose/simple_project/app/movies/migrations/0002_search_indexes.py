@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:04
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('title'), name='gin_trgm_ops'), name='film_work_title_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('description'), name='gin_trgm_ops'), name='film_work_descr_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=models.Index(fields=['rating', 'id'], name='film_work_rating_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='filmwork',
+            index=models.Index(fields=['modified', 'id'], name='film_work_modified_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='genrefilmwork',
+            index=models.Index(fields=['genre', 'film_work'], name='genre_fw_genre_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='personfilmwork',
+            index=models.Index(fields=['person', 'role'], name='person_fw_person_role_idx'),
+        ),
+    ]
@@ -0,0 +1,128 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:06
+
+from django.db import migrations, models
+
+# Дубли удаляются до создания уникальных индексов; остаётся самая ранняя запись
+DEDUPE_GENRE_FILM_WORK = """
+DELETE FROM content.genre_film_work a
+USING content.genre_film_work b
+WHERE a.film_work_id = b.film_work_id
+  AND a.genre_id = b.genre_id
+  AND (a.created, a.id) > (b.created, b.id);
+"""
+
+DEDUPE_PERSON_FILM_WORK = """
+DELETE FROM content.person_film_work a
+USING content.person_film_work b
+WHERE a.film_work_id = b.film_work_id
+  AND a.person_id = b.person_id
+  AND a.role = b.role
+  AND (a.created, a.id) > (b.created, b.id);
+"""
+
+
+# Ограничение может уже существовать, если предыдущий запуск миграции прервался после него
+ADD_UNIQUE_USING_INDEX = """
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = '{name}' AND conrelid = 'content.{table}'::regclass
+    ) THEN
+        ALTER TABLE content.{table} ADD CONSTRAINT "{name}" UNIQUE USING INDEX "{name}";
+    END IF;
+END;
+$$;
+"""
+
+
+def drop_invalid_index(name):
+    """
+    Удаляет индекс, оставшийся INVALID после прерванного CREATE INDEX CONCURRENTLY.
+    Иначе IF NOT EXISTS молча примет его за готовый, и ограничение на нём не создастся.
+    """
+    def operation(apps, schema_editor):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid',
+                ['content.{}'.format(name)])
+            invalid = cursor.fetchone() is not None
+        if invalid:
+            schema_editor.execute('DROP INDEX CONCURRENTLY content."{}";'.format(name))
+    return migrations.RunPython(operation, migrations.RunPython.noop)
+
+
+def index_concurrently(table, name, columns, unique=False):
+    """
+    Индекс строится CONCURRENTLY, без долгой блокировки записи в таблицу.
+    Готовый индекс с таким именем (например, из SQL-схемы) переиспользуется, недостроенный - пересоздаётся.
+    """
+    return [
+        drop_invalid_index(name),
+        migrations.RunSQL(
+            sql='CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON content.{table} ({columns});'.format(
+                unique='UNIQUE ' if unique else '', name=name, table=table, columns=', '.join(columns)),
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS content."{name}";'.format(name=name),
+        ),
+    ]
+
+
+def unique_concurrently(table, name, columns):
+    """
+    Уникальное ограничение без долгой блокировки таблицы: сначала уникальный индекс строится
+    CONCURRENTLY, затем ограничение навешивается на готовый индекс.
+
+    Удаление дублей и построение индекса идут не в одной транзакции: дубль, вставленный между ними,
+    сорвёт построение индекса. Тогда миграцию нужно просто запустить ещё раз - дубли удалятся заново,
+    а недостроенный индекс будет пересоздан.
+    """
+    return index_concurrently(table, name, columns, unique=True) + [
+        migrations.RunSQL(
+            sql=ADD_UNIQUE_USING_INDEX.format(name=name, table=table),
+            reverse_sql='ALTER TABLE content.{table} DROP CONSTRAINT IF EXISTS "{name}";'.format(
+                name=name, table=table),
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('movies', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=index_concurrently('film_work', 'film_work_creation_date_idx', ['creation_date']),
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='filmwork',
+                    index=models.Index(fields=['creation_date'], name='film_work_creation_date_idx'),
+                ),
+            ],
+        ),
+        migrations.RunSQL(DEDUPE_GENRE_FILM_WORK, reverse_sql=migrations.RunSQL.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=unique_concurrently(
+                'genre_film_work', 'film_work_genre_idx', ['film_work_id', 'genre_id']),
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='genrefilmwork',
+                    constraint=models.UniqueConstraint(fields=('film_work', 'genre'), name='film_work_genre_idx'),
+                ),
+            ],
+        ),
+        migrations.RunSQL(DEDUPE_PERSON_FILM_WORK, reverse_sql=migrations.RunSQL.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=unique_concurrently(
+                'person_film_work', 'film_work_person_idx', ['film_work_id', 'person_id', 'role']),
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='personfilmwork',
+                    constraint=models.UniqueConstraint(
+                        fields=('film_work', 'person', 'role'), name='film_work_person_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+# Каждое изменение каталога отправляет в канал content_changes JSON с таблицей и id строки.
+# Для таблиц связей вместо своего id передаются id фильма и персоны/жанра.
+# ETL слушает канал и переиндексирует только затронутые документы.
+CREATE_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.notify_content_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify(
+        'content_changes',
+        (
+            SELECT jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP) || COALESCE(jsonb_object_agg(key, value), '{}')
+            FROM jsonb_each(row_data)
+            WHERE key IN ('id', 'film_work_id', 'person_id', 'genre_id')
+              AND TG_TABLE_NAME IN ('film_work', 'person', 'genre') = (key = 'id')
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_NOTIFY_FUNCTION = "DROP FUNCTION IF EXISTS content.notify_content_change();"
+
+TABLES = ('film_work', 'person', 'genre', 'person_film_work', 'genre_film_work')
+
+
+def create_trigger(table):
+    return """
+    DROP TRIGGER IF EXISTS {table}_notify_change ON content.{table};
+    CREATE TRIGGER {table}_notify_change
+        AFTER INSERT OR UPDATE OR DELETE ON content.{table}
+        FOR EACH ROW EXECUTE FUNCTION content.notify_content_change();
+    """.format(table=table)
+
+
+def drop_trigger(table):
+    return "DROP TRIGGER IF EXISTS {table}_notify_change ON content.{table};".format(table=table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_through_constraints'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_NOTIFY_FUNCTION, reverse_sql=DROP_NOTIFY_FUNCTION),
+    ] + [
+        migrations.RunSQL(create_trigger(table), reverse_sql=drop_trigger(table))
+        for table in TABLES
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:24
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('movies', '0005_person_search_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='genre',
+            index=models.Index(django.db.models.functions.comparison.Collate(django.db.models.functions.text.Upper('name'), 'C'), name='genre_name_letter_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='person',
+            index=models.Index(django.db.models.functions.comparison.Collate(django.db.models.functions.text.Upper('full_name'), 'C'), name='person_name_letter_idx'),
+        ),
+    ]
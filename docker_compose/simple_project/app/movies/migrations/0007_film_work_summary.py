@@ -0,0 +1,168 @@
+# Generated by Django 4.0.4 on 2026-10-18 20:29
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Пересчёт сводки по фильмам: жанры и персоны каждого фильма собираются в массивы
+# теми же агрегатами, что и в API (array_agg DISTINCT) и в запросе ETL (persons).
+CREATE_REFRESH_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.refresh_film_work_summary(film_ids uuid[]) RETURNS void AS $$
+BEGIN
+    -- Пересчёты одного фильма из параллельных транзакций идут по очереди на строке film_work,
+    -- поэтому следующий пересчёт видит связи, закоммиченные предыдущим
+    PERFORM 1 FROM content.film_work WHERE id = ANY(film_ids) ORDER BY id FOR NO KEY UPDATE;
+    INSERT INTO content.film_work_summary AS s (film_work_id, genres, actors, directors, writers, persons)
+    SELECT
+        fw.id,
+        COALESCE(g.genres, '{}'),
+        COALESCE(p.actors, '{}'),
+        COALESCE(p.directors, '{}'),
+        COALESCE(p.writers, '{}'),
+        COALESCE(p.persons, '[]')
+    FROM content.film_work fw
+    CROSS JOIN LATERAL (
+        SELECT array_agg(DISTINCT g.name) AS genres
+        FROM content.genre_film_work gfw
+        JOIN content.genre g ON g.id = gfw.genre_id
+        WHERE gfw.film_work_id = fw.id
+    ) g
+    CROSS JOIN LATERAL (
+        SELECT
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor') AS actors,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'director') AS directors,
+            array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'scenarist') AS writers,
+            jsonb_agg(DISTINCT jsonb_build_object(
+                'person_role', pfw.role,
+                'person_id', p.id,
+                'person_name', p.full_name
+            )) AS persons
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = fw.id
+    ) p
+    WHERE fw.id = ANY(film_ids)
+    ON CONFLICT (film_work_id) DO UPDATE SET
+        genres = EXCLUDED.genres,
+        actors = EXCLUDED.actors,
+        directors = EXCLUDED.directors,
+        writers = EXCLUDED.writers,
+        persons = EXCLUDED.persons
+    WHERE (s.genres, s.actors, s.directors, s.writers, s.persons)
+        IS DISTINCT FROM (EXCLUDED.genres, EXCLUDED.actors, EXCLUDED.directors, EXCLUDED.writers, EXCLUDED.persons);
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Триггеры уровня оператора: одна вставка или удаление многих связей пересчитывает
+# каждый затронутый фильм один раз. Затронутые строки берутся из таблиц переходов.
+CREATE_SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.sync_film_work_summary() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'film_work' THEN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM content.refresh_film_work_summary(ARRAY(SELECT id FROM new_rows));
+        ELSE
+            DELETE FROM content.film_work_summary WHERE film_work_id IN (SELECT id FROM old_rows);
+        END IF;
+    ELSIF TG_TABLE_NAME IN ('person_film_work', 'genre_film_work') THEN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM content.refresh_film_work_summary(ARRAY(SELECT DISTINCT film_work_id FROM new_rows));
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM content.refresh_film_work_summary(ARRAY(SELECT DISTINCT film_work_id FROM old_rows));
+        ELSE
+            PERFORM content.refresh_film_work_summary(ARRAY(
+                SELECT film_work_id FROM new_rows UNION SELECT film_work_id FROM old_rows));
+        END IF;
+    ELSIF TG_TABLE_NAME = 'person' THEN
+        PERFORM content.refresh_film_work_summary(ARRAY(
+            SELECT DISTINCT pfw.film_work_id
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            JOIN content.person_film_work pfw ON pfw.person_id = n.id
+            WHERE n.full_name IS DISTINCT FROM o.full_name));
+    ELSIF TG_TABLE_NAME = 'genre' THEN
+        PERFORM content.refresh_film_work_summary(ARRAY(
+            SELECT DISTINCT gfw.film_work_id
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            JOIN content.genre_film_work gfw ON gfw.genre_id = n.id
+            WHERE n.name IS DISTINCT FROM o.name));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_FUNCTIONS = """
+DROP FUNCTION IF EXISTS content.sync_film_work_summary();
+DROP FUNCTION IF EXISTS content.refresh_film_work_summary(uuid[]);
+"""
+
+BACKFILL = "SELECT content.refresh_film_work_summary(ARRAY(SELECT id FROM content.film_work));"
+
+# Изменение самого фильма сводку не меняет: его поля читаются из film_work
+TRIGGERS = (
+    ('film_work', 'INSERT'),
+    ('film_work', 'DELETE'),
+    ('person_film_work', 'INSERT'),
+    ('person_film_work', 'UPDATE'),
+    ('person_film_work', 'DELETE'),
+    ('genre_film_work', 'INSERT'),
+    ('genre_film_work', 'UPDATE'),
+    ('genre_film_work', 'DELETE'),
+    ('person', 'UPDATE'),
+    ('genre', 'UPDATE'),
+)
+
+TRANSITION_TABLES = {
+    'INSERT': 'NEW TABLE AS new_rows',
+    'UPDATE': 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'OLD TABLE AS old_rows',
+}
+
+
+def create_trigger(table, event):
+    return """
+    DROP TRIGGER IF EXISTS {table}_summary_{op} ON content.{table};
+    CREATE TRIGGER {table}_summary_{op}
+        AFTER {event} ON content.{table}
+        REFERENCING {transition}
+        FOR EACH STATEMENT EXECUTE FUNCTION content.sync_film_work_summary();
+    """.format(table=table, op=event.lower(), event=event, transition=TRANSITION_TABLES[event])
+
+
+def drop_trigger(table, event):
+    return "DROP TRIGGER IF EXISTS {table}_summary_{op} ON content.{table};".format(
+        table=table, op=event.lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_letter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilmworkSummary',
+            fields=[
+                ('film_work', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='summary', serialize=False, to='movies.filmwork')),
+                ('genres', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None)),
+                ('actors', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None)),
+                ('directors', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None)),
+                ('writers', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), default=list, size=None)),
+                ('persons', models.JSONField(default=list)),
+            ],
+            options={
+                'db_table': 'content"."film_work_summary',
+            },
+        ),
+        migrations.RunSQL(CREATE_REFRESH_FUNCTION + CREATE_SYNC_FUNCTION, reverse_sql=DROP_FUNCTIONS),
+    ] + [
+        migrations.RunSQL(create_trigger(table, event), reverse_sql=drop_trigger(table, event))
+        for table, event in TRIGGERS
+    ] + [
+        migrations.RunSQL(BACKFILL, reverse_sql=migrations.RunSQL.noop),
+    ]
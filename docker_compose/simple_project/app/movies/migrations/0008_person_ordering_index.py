@@ -0,0 +1,20 @@
+# Generated by Django 4.0.4 on 2026-10-18 23:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('movies', '0007_film_work_summary'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='person',
+            index=models.Index(fields=['full_name', 'id'], name='person_full_name_id_idx'),
+        ),
+    ]
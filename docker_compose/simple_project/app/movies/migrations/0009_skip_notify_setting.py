@@ -0,0 +1,46 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# Прежнее определение функции, к нему возвращает откат
+change_notify = import_module('movies.migrations.0004_change_notify')
+
+# Массовая загрузка выключает уведомления для своей транзакции через SET LOCAL movies.skip_notify = 'on':
+# иначе каждая строка каждой пачки отправляет своё pg_notify. Другие сессии по-прежнему уведомляют ETL.
+CREATE_NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION content.notify_content_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF current_setting('movies.skip_notify', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify(
+        'content_changes',
+        (
+            SELECT jsonb_build_object('table', TG_TABLE_NAME, 'op', TG_OP) || COALESCE(jsonb_object_agg(key, value), '{}')
+            FROM jsonb_each(row_data)
+            WHERE key IN ('id', 'film_work_id', 'person_id', 'genre_id')
+              AND TG_TABLE_NAME IN ('film_work', 'person', 'genre') = (key = 'id')
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_person_ordering_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_NOTIFY_FUNCTION, reverse_sql=change_notify.CREATE_NOTIFY_FUNCTION),
+    ]
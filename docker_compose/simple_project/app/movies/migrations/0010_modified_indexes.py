@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-19 10:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('movies', '0009_skip_notify_setting'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='genre',
+            index=models.Index(fields=['modified', 'id'], name='genre_modified_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='person',
+            index=models.Index(fields=['modified', 'id'], name='person_modified_idx'),
+        ),
+    ]
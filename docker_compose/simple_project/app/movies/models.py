@@ -1,8 +1,11 @@
 from django.db import models
 
 import uuid
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
 from django.db.models import F, Func
+from django.db.models.functions import Collate, Upper
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 
@@ -40,17 +43,26 @@ class Genre(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"genre"
         verbose_name = 'Жанр'
         verbose_name_plural = 'Жанры'
+        indexes = [
+            # Фильтр по первой букве в админке: диапазон по UPPER(name) в побайтовом порядке
+            models.Index(Collate(Upper('name'), 'C'), name='genre_name_letter_idx'),
+            # Отметки ETL: последняя изменённая строка и выборка после отметки (modified, id)
+            models.Index(fields=['modified', 'id'], name='genre_modified_idx'),
+        ]
 
 class GenreFilmwork(UUIDMixin):
     film_work = models.ForeignKey('Filmwork', on_delete=models.CASCADE)
     genre = models.ForeignKey('Genre', on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
-    constraints = [
-        models.UniqueConstraint(fields=['film_work_id', 'genre_id'], name='film_work_genre_idx'),
-    ]
 
     class Meta:
         db_table = "content\".\"genre_film_work"
+        constraints = [
+            models.UniqueConstraint(fields=['film_work', 'genre'], name='film_work_genre_idx'),
+        ]
+        indexes = [
+            models.Index(fields=['genre', 'film_work'], name='genre_fw_genre_idx'),
+        ]
 
 class Person(UUIDMixin, TimeStampedMixin):
     full_name = models.TextField(_('full_name'), blank=True)
@@ -62,18 +74,31 @@ class Person(UUIDMixin, TimeStampedMixin):
         db_table = "content\".\"person"
         verbose_name = 'Персона'
         verbose_name_plural = 'Персоны'
+        indexes = [
+            # Поиск и автодополнение в админке по icontains строятся на UPPER(...) LIKE
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='person_full_name_trgm_idx'),
+            # Фильтр по первой букве в админке: диапазон по UPPER(full_name) в побайтовом порядке
+            models.Index(Collate(Upper('full_name'), 'C'), name='person_name_letter_idx'),
+            # Сортировка списка и автодополнения в админке
+            models.Index(fields=['full_name', 'id'], name='person_full_name_id_idx'),
+            # Отметки ETL: последняя изменённая строка и выборка после отметки (modified, id)
+            models.Index(fields=['modified', 'id'], name='person_modified_idx'),
+        ]
 
 class PersonFilmwork(UUIDMixin):
     film_work = models.ForeignKey('Filmwork', on_delete=models.CASCADE)
     person = models.ForeignKey('Person', on_delete=models.CASCADE)
     role = models.TextField(_('role'), max_length=9, choices=PersonFilmworkRole.choices, default=PersonFilmworkRole.ACTOR)
     created = models.DateTimeField(auto_now_add=True)
-    constraints = [
-        models.UniqueConstraint(fields=['film_work_id', 'person_id', 'role'], name='film_work_person_idx'),
-    ]
 
     class Meta:
         db_table = "content\".\"person_film_work"
+        constraints = [
+            models.UniqueConstraint(fields=['film_work', 'person', 'role'], name='film_work_person_idx'),
+        ]
+        indexes = [
+            models.Index(fields=['person', 'role'], name='person_fw_person_role_idx'),
+        ]
 
 class Filmwork(UUIDMixin, TimeStampedMixin):
     type = models.TextField(_('type'), max_length=7, choices=FilmworkType.choices, default=FilmworkType.MOVIE)
@@ -85,9 +110,6 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
     certificate = models.CharField(_('certificate'), max_length=512, blank=True)
     file_path = models.FileField(_('file'), blank=True, null=True, upload_to='movies/')
     description = models.TextField(_('description'), blank=True)
-    constraints = [
-        models.Index(fields=['creation_date'], name='film_work_creation_date_idx'),
-    ]
 
     def __str__(self):
         return self.title
@@ -95,4 +117,29 @@ class Filmwork(UUIDMixin, TimeStampedMixin):
     class Meta:
         db_table = "content\".\"film_work"
         verbose_name = 'Кинопроизведение'
-        verbose_name_plural = 'Кинопроизведения'
\ No newline at end of file
+        verbose_name_plural = 'Кинопроизведения'
+        indexes = [
+            models.Index(fields=['creation_date'], name='film_work_creation_date_idx'),
+            # Поиск по icontains строится на UPPER(...) LIKE, поэтому индексы по UPPER
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='film_work_title_trgm_idx'),
+            GinIndex(OpClass(Upper('description'), name='gin_trgm_ops'), name='film_work_descr_trgm_idx'),
+            models.Index(fields=['rating', 'id'], name='film_work_rating_idx'),
+            models.Index(fields=['modified', 'id'], name='film_work_modified_idx'),
+        ]
+
+class FilmworkSummary(models.Model):
+    """
+    Жанры и персоны фильма, заранее собранные в массивы для чтения без соединений.
+    Строки поддерживаются триггерами в Postgres (миграция 0007) и из Django не пишутся.
+    """
+    film_work = models.OneToOneField('Filmwork', primary_key=True, on_delete=models.DO_NOTHING,
+                                     related_name='summary')
+    genres = ArrayField(models.TextField(), default=list)
+    actors = ArrayField(models.TextField(), default=list)
+    directors = ArrayField(models.TextField(), default=list)
+    writers = ArrayField(models.TextField(), default=list)
+    # Персоны в формате запроса ETL: [{"person_role", "person_id", "person_name"}]
+    persons = models.JSONField(default=list)
+
+    class Meta:
+        db_table = "content\".\"film_work_summary"
@@ -1,8 +1,41 @@
 import datetime
-from django.db.models.signals import post_save
+import logging
+
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from movies.admin_filters import invalidate_letters
+from movies.cache import invalidate_catalog
+from movies.counts import invalidate_count
+
+logger = logging.getLogger(__name__)
+
 @receiver(post_save, sender='movies.Filmwork')
 def attention(sender, instance, created, **kwargs):
     if created and instance.creation_date == datetime.date.today():
-        print(f"Сегодня премьера {instance.title}! 🥳")
\ No newline at end of file
+        logger.info('Сегодня премьера %s!', instance.title)
+
+@receiver(post_save, sender='movies.Filmwork')
+@receiver(post_delete, sender='movies.Filmwork')
+def reset_filmwork_count(sender, **kwargs):
+    invalidate_count(sender)
+
+@receiver(post_save, sender='movies.Filmwork')
+@receiver(post_delete, sender='movies.Filmwork')
+@receiver(post_save, sender='movies.Person')
+@receiver(post_delete, sender='movies.Person')
+@receiver(post_save, sender='movies.Genre')
+@receiver(post_delete, sender='movies.Genre')
+@receiver(post_save, sender='movies.PersonFilmwork')
+@receiver(post_delete, sender='movies.PersonFilmwork')
+@receiver(post_save, sender='movies.GenreFilmwork')
+@receiver(post_delete, sender='movies.GenreFilmwork')
+def reset_api_cache(sender, **kwargs):
+    invalidate_catalog()
+
+@receiver(post_save, sender='movies.Person')
+@receiver(post_delete, sender='movies.Person')
+@receiver(post_save, sender='movies.Genre')
+@receiver(post_delete, sender='movies.Genre')
+def reset_admin_letters(sender, **kwargs):
+    invalidate_letters(sender)
@@ -0,0 +1,155 @@
+import logging
+import queue
+import threading
+import time
+
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import BulkIndexError, streaming_bulk
+
+from status_check import State
+
+_STOP = object()
+
+
+def expand_pair(pair):
+    """Действие для streaming_bulk уже подготовлено prepare_to_elastic_* в виде [заголовок, документ]."""
+    return pair[0], pair[1]
+
+
+class BulkWriter:
+    """
+    Конвейерная запись в Elasticsearch.
+
+    Чтение из Postgres и запись в Elasticsearch идут одновременно: читатель кладёт пачки
+    в ограниченную очередь, а несколько потоков-писателей отправляют их через streaming_bulk.
+    Если писатели не успевают, очередь заполняется и put() блокирует читателя.
+    Отметки потоков сохраняются строго в порядке поступления пачек и только после того,
+    как все предыдущие пачки записаны без ошибок.
+
+    :param connection: Соединение с Elasticsearch
+    :param status: Состояние, в которое сохраняются отметки потоков (None, если пачки без отметок)
+    :param workers: количество потоков-писателей
+    :param queue_size: сколько пачек может ждать записи
+    :param chunk_size: максимум документов в одном запросе _bulk
+    :param max_chunk_bytes: максимум байт в одном запросе _bulk
+    :param max_retries: сколько раз повторять документы, отклонённые с 429
+    :param epoch: номер сброса отметок на начало загрузки; после нового сброса отметки не сохраняются
+    """
+
+    def __init__(self, connection: Elasticsearch, status: State, workers=4, queue_size=8,
+                 chunk_size=500, max_chunk_bytes=10 * 1024 * 1024, max_retries=5, epoch=None):
+        self.conn = connection
+        self.status = status
+        self.epoch = epoch
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.error = None
+        self.docs = 0
+        self.started = None
+        self._seq = 0
+        self._next_commit = 0
+        self._done = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self.started = time.monotonic()
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, stream, actions, checkpoint=None, on_commit=None):
+        """
+        Поставить пачку в очередь на запись.
+
+        :param stream: имя потока, чью отметку двигает пачка
+        :param actions: список пар [заголовок, документ]
+        :param checkpoint: отметка (modified, id), которую можно сохранить после записи пачки
+        :param on_commit: функция без аргументов, вызываемая вместе с сохранением отметки пачки
+        """
+        self._raise_error()
+        self.queue.put((self._seq, stream, actions, checkpoint, on_commit))
+        self._seq += 1
+
+    def close(self):
+        """Дождаться записи всех пачек, остановить писателей и вывести скорость записи."""
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        elapsed = time.monotonic() - self.started if self.started else 0
+        logging.info('Indexed %s docs in %.1f s (%.0f docs/sec)',
+                     self.docs, elapsed, self.docs / elapsed if elapsed else 0)
+        self._raise_error()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _write(self, actions):
+        errors = []
+        written = 0
+        for ok, item in streaming_bulk(
+                self.conn, actions,
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=self.max_chunk_bytes,
+                max_retries=self.max_retries,
+                expand_action_callback=expand_pair,
+                raise_on_error=False,
+                raise_on_exception=False):
+            # Удаление документа, которого нет в индексе (например, ещё не проиндексированного), - не ошибка
+            if ok or item.get('delete', {}).get('status') == 404:
+                written += 1
+            else:
+                errors.append(item)
+        if errors:
+            raise BulkIndexError('{} document(s) failed to index.'.format(len(errors)), errors)
+        return written
+
+    def _work(self):
+        while (task := self.queue.get()) is not _STOP:
+            seq, stream, actions, checkpoint, on_commit = task
+            error = None
+            written = 0
+            if self.error is None:
+                try:
+                    written = self._write(actions) if actions else 0
+                except Exception as err:
+                    logging.error('bulk error', exc_info=True)
+                    error = err
+            self._commit(seq, stream, checkpoint, on_commit, written, error)
+
+    def _commit(self, seq, stream, checkpoint, on_commit, written, error):
+        with self.lock:
+            self.docs += written
+            self._done[seq] = (stream, checkpoint, on_commit, error)
+            while self.error is None and self._next_commit in self._done:
+                stream, checkpoint, on_commit, error = self._done.pop(self._next_commit)
+                if error is not None:
+                    # После неудачной пачки отметки больше не двигаем
+                    self.error = error
+                    break
+                try:
+                    if on_commit:
+                        on_commit()
+                    if checkpoint:
+                        self.status.set_checkpoint(stream, checkpoint, self.epoch)
+                except Exception as err:
+                    # Поток не должен умереть молча: ошибка всплывёт в put() или close(),
+                    # а очередь продолжит разбираться без записи
+                    logging.error('commit error', exc_info=True)
+                    self.error = err
+                    break
+                self._next_commit += 1
@@ -1,5 +1,8 @@
+import contextlib
 import logging
 import os
+import signal
+import threading
 import time
 from functools import wraps
 
@@ -7,9 +10,57 @@ import psycopg2
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
 from elasticsearch import Elasticsearch
+import indices
+from fingerprint import DocumentHashes
+from listener import ChangeListener
 from load_data import PostgresLoader, ElasticSearchSaver
 from status_check import get_status
 
+# Выставляется по SIGTERM/SIGINT: текущая пачка дописывается, отметки сохраняются, и ETL завершается
+stop_event = threading.Event()
+
+
+def get_postgres_loader(pg_conn: _connection):
+    return PostgresLoader(
+        pg_conn,
+        itersize=int(os.environ.get('ETL_ITERSIZE', 200)),
+        strict=os.environ.get('ETL_STRICT', False) == 'True',
+        sql_documents=os.environ.get('ETL_SQL_DOCUMENTS', False) == 'True',
+        film_summary=os.environ.get('ETL_FILM_SUMMARY', False) == 'True',
+    )
+
+
+def get_document_hashes(connection: Elasticsearch):
+    """Хранилище отпечатков документов или None, если ETL_HASH_DB задан пустым."""
+    path = os.environ.get('ETL_HASH_DB', 'hashes.sqlite3')
+    if not path:
+        return None
+    hashes = DocumentHashes(path)
+    hashes.prune(indices.get_all_index_uuids(connection))
+    return hashes
+
+
+def get_es_saver(connection: Elasticsearch):
+    return ElasticSearchSaver(
+        connection,
+        stop_event=stop_event,
+        hashes=get_document_hashes(connection),
+        workers=int(os.environ.get('ETL_BULK_WORKERS', 4)),
+        queue_size=int(os.environ.get('ETL_BULK_QUEUE_SIZE', 8)),
+        chunk_size=int(os.environ.get('ETL_BULK_CHUNK_SIZE', 500)),
+        max_chunk_bytes=int(os.environ.get('ETL_BULK_CHUNK_BYTES', 10 * 1024 * 1024)),
+        max_retries=int(os.environ.get('ETL_BULK_RETRIES', 5)),
+    )
+
+
+def get_index_settings():
+    """Постоянные настройки индексов Elasticsearch из окружения."""
+    return {
+        'number_of_shards': int(os.environ.get('ES_NUMBER_OF_SHARDS', 1)),
+        'number_of_replicas': int(os.environ.get('ES_NUMBER_OF_REPLICAS', 0)),
+        'refresh_interval': os.environ.get('ES_REFRESH_INTERVAL', '1s'),
+    }
+
 
 def load_from_pysql(connection: Elasticsearch, pg_conn: _connection, status):
     """
@@ -19,12 +70,61 @@ def load_from_pysql(connection: Elasticsearch, pg_conn: _connection, status):
     :param pg_conn: Соединение с Postgres
     :param status: Экземпляр класса, отвечающий за получение/загрузку состояния.
     """
-    postgres_loader = PostgresLoader(pg_conn)
-    es_saver = ElasticSearchSaver(connection)
+    postgres_loader = get_postgres_loader(pg_conn)
+    es_saver = get_es_saver(connection)
     es_saver.save_data(postgres_loader, status)
 
 
-def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10):
+def listen_changes(listener: ChangeListener, es_saver: ElasticSearchSaver, postgres_loader: PostgresLoader,
+                   pg_conn: _connection, timeout):
+    """
+    Обрабатывает уведомления об изменениях, пока не истечёт timeout или не придёт сигнал остановки.
+    """
+    deadline = time.monotonic() + timeout
+    while not stop_event.is_set() and (left := deadline - time.monotonic()) > 0:
+        # Ждём короткими отрезками, чтобы быстро реагировать на сигнал остановки
+        changes = listener.wait(min(left, 1.0))
+        if changes:
+            es_saver.save_changes(postgres_loader, changes)
+            pg_conn.commit()
+
+
+def run_daemon(connection: Elasticsearch, pg_conn: _connection, status,
+               min_interval=1.0, max_interval=60.0, factor=2.0,
+               listener: ChangeListener = None, catchup_interval=300.0):
+    """
+    Постоянная загрузка данных из Postgres в Elasticsearch на открытых соединениях.
+
+    Если в цикле нашлись изменения, следующий опрос будет через min_interval.
+    Пока изменений нет, пауза растёт в factor раз до max_interval.
+    Если передан listener, изменения приходят через LISTEN/NOTIFY и индексируются сразу,
+    а сканирование по modified остаётся страховкой и запускается раз в catchup_interval.
+
+    :param connection: Соединение с Elasticsearch
+    :param pg_conn: Соединение с Postgres
+    :param status: Экземпляр класса, отвечающий за получение/загрузку состояния.
+    :param min_interval: минимальная пауза между циклами, сек
+    :param max_interval: максимальная пауза между циклами, сек
+    :param factor: во сколько раз растёт пауза, пока нет изменений
+    :param listener: подписка на уведомления об изменениях
+    :param catchup_interval: пауза между сканированиями по modified при работе с listener, сек
+    """
+    postgres_loader = get_postgres_loader(pg_conn)
+    es_saver = get_es_saver(connection)
+    interval = min_interval
+    while not stop_event.is_set():
+        changed = es_saver.save_data(postgres_loader, status)
+        # Закрываем транзакцию, чтобы соединение не висело в idle in transaction между циклами
+        pg_conn.commit()
+        if listener:
+            listen_changes(listener, es_saver, postgres_loader, pg_conn, catchup_interval)
+            continue
+        interval = min_interval if changed else min(interval * factor, max_interval)
+        stop_event.wait(interval)
+    logging.info('ETL stopped')
+
+
+def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10, reset_after=60):
     """
     Функция для повторного выполнения функции через некоторое время, если возникла ошибка.
     Использует наивный экспоненциальный рост времени повтора (factor) до граничного времени ожидания (border_sleep_time)
@@ -32,9 +132,13 @@ def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10):
     Формула:
         t = start_sleep_time * 2^(n) if t < border_sleep_time
         t = border_sleep_time if t >= border_sleep_time
+
+    Считаются только подряд идущие ошибки: если функция проработала reset_after секунд и только потом
+    упала, это новая ошибка после успешной работы, и счётчик попыток и пауза начинаются заново.
     :param start_sleep_time: начальное время повтора
     :param factor: во сколько раз нужно увеличить время ожидания
     :param border_sleep_time: граничное время ожидания
+    :param reset_after: сколько секунд работы без ошибки сбрасывают счётчик попыток
     :return: результат выполнения функции
     """
 
@@ -44,40 +148,78 @@ def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10):
             delay = start_sleep_time
             num = 1
             while True:
+                started = time.monotonic()
                 try:
-                    return func()
-                    delay = start_sleep_time
-                    time.sleep(border_sleep_time)
+                    return func(*args, **kwargs)
                 except Exception as err:
                     logging.error("err", exc_info=True)
-                    time.sleep(delay)
+                    if time.monotonic() - started >= reset_after:
+                        delay = start_sleep_time
+                        num = 1
+                    # После сигнала остановки не переподключаемся
+                    if stop_event.wait(delay):
+                        break
                     num += 1
                     if num > 10:
                         break
-                    if delay >= border_sleep_time:
-                        delay = border_sleep_time
-                    else:
-                        delay = min(delay * factor, border_sleep_time)
+                    delay = min(delay * factor, border_sleep_time)
             logging.info('timeout')
 
         return inner
 
     return func_wrapper
 
+def get_dsl():
+    """Параметры подключения к Postgres из окружения."""
+    return {'dbname': os.environ.get('DB_NAME'), 'user': os.environ.get('DB_USER'),
+            'password': os.environ.get('DB_PASSWORD'), 'host': os.environ.get('DB_HOST'),
+            'port': os.environ.get('DB_PORT')}
+
+
 @backoff()
 def connection():
     """Функция отвечающая за подключение к базам данных"""
-    dsl = {'dbname': os.environ.get('DB_NAME'), 'user': os.environ.get('DB_USER'),
-           'password': os.environ.get('DB_PASSWORD'), 'host': os.environ.get('DB_HOST'),
-           'port': os.environ.get('DB_PORT')}
-    with psycopg2.connect(**dsl, cursor_factory=DictCursor) as pg_conn, \
+    dsl = get_dsl()
+    # with по соединению psycopg2 только завершает транзакцию; закрывает его closing,
+    # иначе каждый перезапуск из backoff оставлял бы открытым соединение с Postgres
+    with contextlib.closing(psycopg2.connect(**dsl, cursor_factory=DictCursor)) as pg_conn, pg_conn, \
             Elasticsearch(os.environ.get('ELASTIC_PORT')) as es:
+        indices.ensure_indices(es, get_index_settings())
         status = get_status('status.json')
-        load_from_pysql(es, pg_conn, status)
+        if os.environ.get('ETL_DAEMON', False) == 'True':
+            listener = None
+            if os.environ.get('ETL_LISTEN', False) == 'True':
+                listener = ChangeListener(
+                    dsl,
+                    debounce=float(os.environ.get('ETL_LISTEN_DEBOUNCE', 0.5)),
+                    max_delay=float(os.environ.get('ETL_LISTEN_MAX_DELAY', 5)),
+                    max_batch=int(os.environ.get('ETL_LISTEN_MAX_BATCH', 1000)),
+                )
+            try:
+                run_daemon(
+                    es, pg_conn, status,
+                    min_interval=float(os.environ.get('ETL_POLL_MIN_INTERVAL', 1)),
+                    max_interval=float(os.environ.get('ETL_POLL_MAX_INTERVAL', 60)),
+                    factor=float(os.environ.get('ETL_POLL_FACTOR', 2)),
+                    listener=listener,
+                    catchup_interval=float(os.environ.get('ETL_CATCHUP_INTERVAL', 300)),
+                )
+            finally:
+                if listener:
+                    listener.close()
+        else:
+            load_from_pysql(es, pg_conn, status)
+
+
+def handle_stop(signum, frame):
+    logging.info('Received signal %s, finishing current batch', signum)
+    stop_event.set()
 
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, filename="logs.log", filemode="w",
                         format="%(asctime)s %(levelname)s %(message)s")
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
     # Добавила паузы по 10 сек. При обрыве подключения после 10 попытки скрипт завершается.
     connection()
@@ -29,96 +29,29 @@ def get_list_update_filmwork_query(fw_modified):
             LEFT JOIN content.genre g ON g.id = gfw.genre_id
             {}
             GROUP BY fw.id
-            ORDER BY fw.modified;""".format(fw_modified)
-
-def get_list_update_person_query(p_modified):
-    """
-        Функция с созданием запроса по персонам.
-        :return: передача в функцию для дальнейшего сбора данных
-            """
-    return """SELECT
-       fw.id,
-       fw.title,
-       fw.description,
-       fw.rating,
-       fw.type,
-       fw.created,
-       max(p.modified) as modified,
-       COALESCE (
-           json_agg(
-               DISTINCT jsonb_build_object(
-                   'person_role', pfw.role,
-                   'person_id', p.id,
-                   'person_name', p.full_name
-               )
-           ) FILTER (WHERE p.id is not null),
-           '[]'
-       ) as persons,
-       array_agg(DISTINCT g.name) as genres
-    FROM content.film_work fw
-    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
-    LEFT JOIN content.person p ON p.id = pfw.person_id
-    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
-    LEFT JOIN content.genre g ON g.id = gfw.genre_id
-    {}
-    GROUP BY fw.id
-    ORDER BY fw.modified;""".format(p_modified)
-
-def get_list_update_genre_query(g_modified):
-    """
-    Функция с созданием запроса по жанрам.
-    :return: передача в функцию для дальнейшего сбора данных
-    """
-    return """SELECT
-       fw.id,
-       fw.title,
-       fw.description,
-       fw.rating,
-       fw.type,
-       fw.created,
-       max(g.modified) as modified,
-       COALESCE (
-           json_agg(
-               DISTINCT jsonb_build_object(
-                   'person_role', pfw.role,
-                   'person_id', p.id,
-                   'person_name', p.full_name
-               )
-           ) FILTER (WHERE p.id is not null),
-           '[]'
-       ) as persons,
-       array_agg(DISTINCT g.name) as genres
-    FROM content.film_work fw
-    LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
-    LEFT JOIN content.person p ON p.id = pfw.person_id
-    LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
-    LEFT JOIN content.genre g ON g.id = gfw.genre_id
-    {}
-    GROUP BY fw.id
-    ORDER BY fw.modified;""".format(g_modified)
+            ORDER BY fw.modified, fw.id;""".format(fw_modified)
 
 def get_list_update_persons_query(person_modified):
     """
         Функция с созданием запроса по person.
+        Одна строка на персону: роли и фильмы собраны в массивы. Иначе строки одной персоны с разными
+        ролями делили бы одну отметку (modified, id), и граница пачки между ними теряла бы часть ролей.
         :return: передача в функцию для дальнейшего сбора данных
             """
-    return """Select person.id, person.full_name, pfw.role,
-
-                 COALESCE (
-                   json_agg(
-                       DISTINCT jsonb_build_object(
-                           'films', fw.id
-                       )
-                   ) FILTER (WHERE fw.id is not null),
-                   '[]'
-               ) as films,
-array_agg(DISTINCT fw.id) as films123,
-                max(person.modified) as modified
-                from content.person
-                left join content.person_film_work pfw on person.id = pfw.person_id
-                left join content.film_work fw on pfw.film_work_id = fw.id
-                {}
-                group by person.id, pfw.role""".format(person_modified)
+    return """SELECT
+                person.id,
+                person.full_name,
+                COALESCE(array_agg(DISTINCT pfw.role) FILTER (WHERE pfw.role IS NOT NULL), '{{}}') AS roles,
+                COALESCE(
+                    array_agg(DISTINCT pfw.film_work_id::text) FILTER (WHERE pfw.film_work_id IS NOT NULL),
+                    '{{}}'
+                ) AS film_ids,
+                person.modified
+              FROM content.person
+              LEFT JOIN content.person_film_work pfw ON person.id = pfw.person_id
+              {}
+              GROUP BY person.id
+              ORDER BY person.modified, person.id""".format(person_modified)
 
 def get_list_update_genres_query(genre_modified):
     """
@@ -129,5 +62,190 @@ def get_list_update_genres_query(genre_modified):
                 max(genre.modified) as modified
                 from content.genre
                 {}
-                group by genre.id""".format(genre_modified)
+                group by genre.id
+                order by modified, genre.id""".format(genre_modified)
+
+def get_changed_persons_query(person_modified):
+    """
+        Функция с созданием запроса по изменившимся персонам.
+        :return: передача в функцию для дальнейшего сбора данных
+            """
+    return """SELECT id, modified
+              FROM content.person
+              {}
+              ORDER BY modified, id;""".format(person_modified)
+
+def get_changed_genres_query(genre_modified):
+    """
+        Функция с созданием запроса по изменившимся жанрам.
+        :return: передача в функцию для дальнейшего сбора данных
+            """
+    return """SELECT id, modified
+              FROM content.genre
+              {}
+              ORDER BY modified, id;""".format(genre_modified)
 
+def get_film_ids_by_persons_query():
+    """
+        Функция с созданием запроса фильмов, в которых участвуют персоны.
+        :return: запрос с параметром - массивом id персон
+            """
+    return """SELECT DISTINCT film_work_id
+              FROM content.person_film_work
+              WHERE person_id = ANY(%s::uuid[]);"""
+
+def get_film_ids_by_genres_query():
+    """
+        Функция с созданием запроса фильмов с заданными жанрами.
+        :return: запрос с параметром - массивом id жанров
+            """
+    return """SELECT DISTINCT film_work_id
+              FROM content.genre_film_work
+              WHERE genre_id = ANY(%s::uuid[]);"""
+
+def get_filmwork_by_ids_query():
+    """
+        Функция с созданием запроса по фильмам с заданными id.
+        :return: запрос с параметром - массивом id фильмов
+            """
+    return get_list_update_filmwork_query("WHERE fw.id = ANY(%s::uuid[])")
+
+def get_upper_bound_query(table):
+    """
+        Функция с созданием запроса последней изменённой строки таблицы.
+        :return: запрос, возвращающий (modified, id) или пустой результат
+            """
+    return """SELECT modified, id
+              FROM content.{}
+              ORDER BY modified DESC, id DESC
+              LIMIT 1;""".format(table)
+
+def get_persons_by_ids_query():
+    """
+        Функция с созданием запроса по персонам с заданными id.
+        :return: запрос с параметром - массивом id персон
+            """
+    return get_list_update_persons_query("WHERE person.id = ANY(%s::uuid[])")
+
+def get_genres_by_ids_query():
+    """
+        Функция с созданием запроса по жанрам с заданными id.
+        :return: запрос с параметром - массивом id жанров
+            """
+    return get_list_update_genres_query("WHERE genre.id = ANY(%s::uuid[])")
+
+def get_filmwork_documents_query(fw_modified):
+    """
+        Функция с созданием запроса по фильмам, в котором Postgres сам собирает документ Elasticsearch.
+        Документ отдаётся текстом, чтобы psycopg2 не разбирал JSON и он ушёл в bulk как есть.
+        :return: передача в функцию для дальнейшего сбора данных
+            """
+    return """SELECT
+               fw.id,
+               fw.modified,
+               json_build_object(
+                   'id', fw.id,
+                   'title', fw.title,
+                   'description', fw.description,
+                   'imdb_rating', fw.rating,
+                   'genre', COALESCE(array_agg(DISTINCT g.name) FILTER (WHERE g.id IS NOT NULL), '{{}}'),
+                   'director', COALESCE(max(p.full_name) FILTER (WHERE pfw.role = 'director'), ''),
+                   'actors', COALESCE(
+                       json_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name))
+                           FILTER (WHERE pfw.role = 'actor'),
+                       '[]'
+                   ),
+                   'actors_names', COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'actor'), '{{}}'),
+                   'writers', COALESCE(
+                       json_agg(DISTINCT jsonb_build_object('id', p.id, 'name', p.full_name))
+                           FILTER (WHERE pfw.role = 'scenarist'),
+                       '[]'
+                   ),
+                   'writers_names', COALESCE(array_agg(DISTINCT p.full_name) FILTER (WHERE pfw.role = 'scenarist'), '{{}}')
+               )::text AS document
+            FROM content.film_work fw
+            LEFT JOIN content.person_film_work pfw ON pfw.film_work_id = fw.id
+            LEFT JOIN content.person p ON p.id = pfw.person_id
+            LEFT JOIN content.genre_film_work gfw ON gfw.film_work_id = fw.id
+            LEFT JOIN content.genre g ON g.id = gfw.genre_id
+            {}
+            GROUP BY fw.id
+            ORDER BY fw.modified, fw.id;""".format(fw_modified)
+
+def get_filmwork_documents_by_ids_query():
+    """
+        Функция с созданием запроса готовых документов фильмов с заданными id.
+        :return: запрос с параметром - массивом id фильмов
+            """
+    return get_filmwork_documents_query("WHERE fw.id = ANY(%s::uuid[])")
+
+def get_filmwork_summary_query(fw_modified):
+    """
+        Функция с созданием запроса по фильмам из сводной таблицы film_work_summary.
+        Колонки те же, что у get_list_update_filmwork_query, но персоны и жанры уже собраны триггерами.
+        :return: передача в функцию для дальнейшего сбора данных
+            """
+    return """SELECT
+               fw.id,
+               fw.title,
+               fw.description,
+               fw.rating,
+               fw.type,
+               fw.created,
+               fw.modified,
+               s.persons,
+               s.genres
+            FROM content.film_work fw
+            JOIN content.film_work_summary s ON s.film_work_id = fw.id
+            {}
+            ORDER BY fw.modified, fw.id;""".format(fw_modified)
+
+def get_filmwork_summary_by_ids_query():
+    """
+        Функция с созданием запроса по фильмам с заданными id из сводной таблицы.
+        :return: запрос с параметром - массивом id фильмов
+            """
+    return get_filmwork_summary_query("WHERE fw.id = ANY(%s::uuid[])")
+
+def get_filmwork_summary_documents_query(fw_modified):
+    """
+        Функция с созданием запроса готовых документов фильмов из сводной таблицы film_work_summary.
+        Документ совпадает с get_filmwork_documents_query, но собирается без соединения со связями.
+        :return: передача в функцию для дальнейшего сбора данных
+            """
+    return """SELECT
+               fw.id,
+               fw.modified,
+               json_build_object(
+                   'id', fw.id,
+                   'title', fw.title,
+                   'description', fw.description,
+                   'imdb_rating', fw.rating,
+                   'genre', s.genres,
+                   'director', COALESCE((SELECT max(name) FROM unnest(s.directors) name), ''),
+                   'actors', (
+                       SELECT COALESCE(json_agg(jsonb_build_object(
+                           'id', person->'person_id', 'name', person->'person_name') ORDER BY n), '[]')
+                       FROM jsonb_array_elements(s.persons) WITH ORDINALITY AS persons(person, n)
+                       WHERE person->>'person_role' = 'actor'
+                   ),
+                   'actors_names', s.actors,
+                   'writers', (
+                       SELECT COALESCE(json_agg(jsonb_build_object(
+                           'id', person->'person_id', 'name', person->'person_name') ORDER BY n), '[]')
+                       FROM jsonb_array_elements(s.persons) WITH ORDINALITY AS persons(person, n)
+                       WHERE person->>'person_role' = 'scenarist'
+                   ),
+                   'writers_names', s.writers
+               )::text AS document
+            FROM content.film_work fw
+            JOIN content.film_work_summary s ON s.film_work_id = fw.id
+            {}
+            ORDER BY fw.modified, fw.id;""".format(fw_modified)
+
+def get_filmwork_summary_documents_by_ids_query():
+    """
+        Функция с созданием запроса готовых документов фильмов с заданными id из сводной таблицы.
+        :return: запрос с параметром - массивом id фильмов
+            """
+    return get_filmwork_summary_documents_query("WHERE fw.id = ANY(%s::uuid[])")
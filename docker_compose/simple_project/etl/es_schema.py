@@ -0,0 +1,84 @@
+# Схема индексов Elasticsearch, которыми владеет ETL.
+# При изменении маппинга или анализаторов нужно увеличить SCHEMA_VERSION: номер хранится
+# в _meta индекса, и по нему при старте видно, что живой индекс отстаёт от схемы.
+SCHEMA_VERSION = 2
+
+ANALYSIS = {
+    'filter': {
+        'english_stop': {'type': 'stop', 'stopwords': '_english_'},
+        'english_stemmer': {'type': 'stemmer', 'language': 'english'},
+        'english_possessive_stemmer': {'type': 'stemmer', 'language': 'possessive_english'},
+        'russian_stop': {'type': 'stop', 'stopwords': '_russian_'},
+        'russian_stemmer': {'type': 'stemmer', 'language': 'russian'},
+    },
+    'analyzer': {
+        'ru_en': {
+            'tokenizer': 'standard',
+            'filter': [
+                'lowercase',
+                'english_stop',
+                'english_stemmer',
+                'english_possessive_stemmer',
+                'russian_stop',
+                'russian_stemmer',
+            ],
+        },
+    },
+}
+
+TEXT = {'type': 'text', 'analyzer': 'ru_en'}
+TEXT_WITH_RAW = {**TEXT, 'fields': {'raw': {'type': 'keyword'}}}
+PERSON = {
+    'type': 'nested',
+    'dynamic': 'strict',
+    'properties': {
+        'id': {'type': 'keyword'},
+        'name': TEXT,
+    },
+}
+
+MAPPINGS = {
+    'film': {
+        'dynamic': 'strict',
+        # Списки имён дублируют actors/writers и нужны только для поиска
+        '_source': {'excludes': ['actors_names', 'writers_names']},
+        'properties': {
+            'id': {'type': 'keyword'},
+            'imdb_rating': {'type': 'float'},
+            'genre': {'type': 'keyword'},
+            'title': TEXT_WITH_RAW,
+            'description': TEXT,
+            'director': TEXT,
+            'actors_names': TEXT,
+            'writers_names': TEXT,
+            'actors': PERSON,
+            'writers': PERSON,
+        },
+    },
+    'person': {
+        'dynamic': 'strict',
+        'properties': {
+            'id': {'type': 'keyword'},
+            'full_name': TEXT_WITH_RAW,
+            'role': {'type': 'keyword'},
+            'film_ids': {'type': 'keyword'},
+        },
+    },
+    'genre': {
+        'dynamic': 'strict',
+        'properties': {
+            'id': {'type': 'keyword'},
+            'name': {'type': 'keyword', 'fields': {'text': TEXT}},
+        },
+    },
+}
+
+
+def get_mappings(kind):
+    """Маппинг вида документа с номером версии схемы в _meta."""
+    return {**MAPPINGS[kind], '_meta': {'schema_version': SCHEMA_VERSION}}
+
+
+def get_settings(settings):
+    """Настройки индекса: анализаторы схемы и постоянные настройки из окружения."""
+    return {**settings, 'analysis': ANALYSIS}
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+
+def fingerprint(document):
+    """
+    Отпечаток документа: хеш канонического JSON (ключи по алфавиту, без пробелов).
+    Документ, уже собранный в Postgres JSON-текстом, хешируется как есть.
+    """
+    if isinstance(document, str):
+        data = document
+    else:
+        data = json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class DocumentHashes:
+    """
+    Локальное хранилище отпечатков документов, записанных в Elasticsearch.
+
+    Перед отправкой каждый документ сравнивается с отпечатком последней записанной версии.
+    Совпавшие документы в bulk не попадают. Отпечатки хранятся по uuid конкретного индекса,
+    а не по алиасу: после переиндексации или пересоздания индекса отпечатки старого индекса
+    к новому не применяются. Отпечаток сохраняется только после успешной записи пачки.
+
+    :param path: путь к файлу SQLite
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        # Файл может открываться одновременно несколькими процессами выгрузки по частям
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS doc_hash ('
+            ' index_uuid TEXT NOT NULL, doc_id TEXT NOT NULL, hash TEXT NOT NULL,'
+            ' PRIMARY KEY (index_uuid, doc_id)) WITHOUT ROWID')
+        self.conn.commit()
+        self.checked = 0
+        self.skipped = 0
+
+    def close(self):
+        self.conn.close()
+
+    def reset_counters(self):
+        self.checked = 0
+        self.skipped = 0
+
+    def _stored(self, index_uuid, doc_ids):
+        stored = {}
+        # Не больше 500 параметров в запросе: у старых сборок SQLite лимит 999
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            with self.lock:
+                stored.update(self.conn.execute(
+                    'SELECT doc_id, hash FROM doc_hash WHERE index_uuid = ? AND doc_id IN ({})'.format(
+                        ', '.join('?' * len(chunk))),
+                    [index_uuid, *chunk]))
+        return stored
+
+    def filter(self, index_uuid, actions):
+        """
+        Отбрасывает документы, не изменившиеся с последней записи.
+        :param index_uuid: uuid индекса, в который пишется пачка
+        :param actions: пары [заголовок, документ] из prepare_to_elastic_* или prepare_delete
+        :return: (изменившиеся действия, отпечатки для сохранения после записи)
+        """
+        if not actions:
+            return actions, []
+        doc_ids = [str(next(iter(header.values()))['_id']) for header, _ in actions]
+        stored = self._stored(index_uuid, doc_ids)
+        changed = []
+        hashes = []
+        for doc_id, action in zip(doc_ids, actions):
+            header, document = action
+            # Удаление всегда отправляется, а отпечаток стирается
+            doc_hash = fingerprint(document) if document is not None else None
+            if doc_hash is not None and stored.get(doc_id) == doc_hash:
+                continue
+            changed.append(action)
+            hashes.append((index_uuid, doc_id, doc_hash))
+        with self.lock:
+            self.checked += len(actions)
+            self.skipped += len(actions) - len(changed)
+        return changed, hashes
+
+    def remember(self, hashes):
+        """Сохраняет отпечатки записанных документов; отпечаток None удаляет запись."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO doc_hash (index_uuid, doc_id, hash) VALUES (?, ?, ?)',
+                [row for row in hashes if row[2] is not None])
+            self.conn.executemany(
+                'DELETE FROM doc_hash WHERE index_uuid = ? AND doc_id = ?',
+                [row[:2] for row in hashes if row[2] is None])
+
+    def prune(self, index_uuids):
+        """Удаляет отпечатки индексов, которых больше нет."""
+        placeholders = ', '.join('?' * len(index_uuids))
+        with self.lock, self.conn:
+            self.conn.execute(
+                'DELETE FROM doc_hash WHERE index_uuid NOT IN ({})'.format(placeholders or "''"),
+                list(index_uuids))
@@ -0,0 +1,202 @@
+import logging
+import re
+
+from elasticsearch import BadRequestError, Elasticsearch, NotFoundError
+
+import es_schema
+
+# Имя, под которым индекс виден читателям и инкрементальной загрузке. Это алиас на movies_v{N}
+INDEX_NAMES = {
+    'film': 'movies',
+    'person': 'person',
+    'genre': 'genre',
+}
+
+# Настройки на время полной загрузки: без реплик и без обновления поиска
+BULK_LOAD_SETTINGS = {'number_of_replicas': 0, 'refresh_interval': '-1'}
+
+
+def versioned_name(alias, version):
+    return '{}_v{}'.format(alias, version)
+
+
+def get_version(alias, index):
+    """Номер версии из имени индекса alias_v{N} или None для индекса без версии."""
+    match = re.fullmatch(r'{}_v(\d+)'.format(re.escape(alias)), index)
+    return int(match.group(1)) if match else None
+
+
+def get_versions(es: Elasticsearch, alias):
+    """
+    Функция, возвращающая номера существующих версий индекса alias_v{N} по возрастанию.
+    """
+    try:
+        names = es.indices.get(index='{}_v*'.format(alias)).keys()
+    except NotFoundError:
+        return []
+    return sorted(version for name in names if (version := get_version(alias, name)) is not None)
+
+
+def get_alias_indices(es: Elasticsearch, alias):
+    """Функция, возвращающая индексы, на которые сейчас указывает алиас."""
+    try:
+        return list(es.indices.get_alias(name=alias).keys())
+    except NotFoundError:
+        return []
+
+
+def get_index_uuid(es: Elasticsearch, name):
+    """uuid конкретного индекса, на который указывает алиас или имя индекса."""
+    settings = next(iter(es.indices.get_settings(index=name).values()))['settings']
+    return settings['index']['uuid']
+
+
+def get_all_index_uuids(es: Elasticsearch):
+    """uuid всех индексов ETL, включая прежние версии, оставленные для отката."""
+    patterns = ','.join('{0},{0}_v*'.format(alias) for alias in INDEX_NAMES.values())
+    response = es.indices.get_settings(index=patterns, ignore_unavailable=True, allow_no_indices=True)
+    return {item['settings']['index']['uuid'] for item in response.values()}
+
+
+def create_version(es: Elasticsearch, kind, settings):
+    """
+    Создаёт следующую версию индекса с маппингом и настройками для полной загрузки.
+    :param kind: вид документа: film, person или genre
+    :param settings: постоянные настройки индекса, к которым добавляются BULK_LOAD_SETTINGS
+    :return: имя созданного индекса
+    """
+    alias = INDEX_NAMES[kind]
+    versions = get_versions(es, alias)
+    index = versioned_name(alias, versions[-1] + 1 if versions else 1)
+    es.indices.create(
+        index=index,
+        mappings=es_schema.get_mappings(kind),
+        settings={**es_schema.get_settings(settings), **BULK_LOAD_SETTINGS},
+    )
+    logging.info('Created index %s', index)
+    return index
+
+
+def finish_version(es: Elasticsearch, index, settings):
+    """
+    Возвращает индексу постоянные настройки после загрузки и сливает сегменты.
+    Реплики включаются уже после слияния, чтобы не копировать мелкие сегменты.
+    """
+    es.indices.put_settings(index=index, settings={'refresh_interval': settings.get('refresh_interval', '1s')})
+    es.indices.refresh(index=index)
+    es.indices.forcemerge(index=index, max_num_segments=1)
+    es.indices.put_settings(index=index, settings={'number_of_replicas': settings.get('number_of_replicas', 1)})
+
+
+def swap_alias(es: Elasticsearch, kind, index):
+    """
+    Одним запросом переключает алиас на новый индекс. Прежние версии остаются для отката.
+    Индекс старой схемы без версий, занимающий имя алиаса, удаляется в том же запросе.
+    """
+    alias = INDEX_NAMES[kind]
+    actions = [{'remove': {'index': old, 'alias': alias}} for old in get_alias_indices(es, alias) if old != index]
+    if not actions and es.indices.exists(index=alias) and not es.indices.exists_alias(name=alias):
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': index, 'alias': alias}})
+    es.indices.update_aliases(actions=actions)
+    logging.info('Alias %s -> %s', alias, index)
+
+
+def drop_old_versions(es: Elasticsearch, kind, keep=2):
+    """Удаляет старые версии индекса, оставляя keep последних (текущую и предыдущую для отката)."""
+    alias = INDEX_NAMES[kind]
+    current = set(get_alias_indices(es, alias))
+    for version in get_versions(es, alias)[:-keep] if keep else []:
+        index = versioned_name(alias, version)
+        if index not in current:
+            es.indices.delete(index=index)
+            logging.info('Deleted index %s', index)
+
+
+def rollback(es: Elasticsearch, kind):
+    """
+    Переключает алиас на предыдущую версию индекса.
+    :return: имя индекса, на который указывает алиас, или None, если откатываться некуда
+    """
+    alias = INDEX_NAMES[kind]
+    current = [version for name in get_alias_indices(es, alias) if (version := get_version(alias, name)) is not None]
+    previous = [version for version in get_versions(es, alias) if current and version < min(current)]
+    if not previous:
+        logging.warning('No previous version of %s to roll back to', alias)
+        return None
+    index = versioned_name(alias, previous[-1])
+    swap_alias(es, kind, index)
+    return index
+
+
+def diff_mapping(expected, live, path=''):
+    """
+    Функция, сравнивающая ожидаемый маппинг с живым.
+    Живой маппинг может содержать больше ключей (значения по умолчанию), сравниваются только ожидаемые.
+    :return: список путей, где маппинг расходится со схемой
+    """
+    diffs = []
+    for key, value in expected.items():
+        key_path = '{}.{}'.format(path, key) if path else key
+        if key == 'type' and value == 'object':
+            # Для объектов Elasticsearch не возвращает type
+            continue
+        if key not in live:
+            diffs.append(key_path)
+        elif isinstance(value, dict) and isinstance(live[key], dict):
+            diffs.extend(diff_mapping(value, live[key], key_path))
+        elif value != live[key]:
+            diffs.append(key_path)
+    return diffs
+
+
+def get_live_mapping(es: Elasticsearch, kind):
+    """Маппинг индекса, на который указывает алиас вида документа."""
+    response = es.indices.get_mapping(index=INDEX_NAMES[kind])
+    return next(iter(response.values()))['mappings']
+
+
+def ensure_index(es: Elasticsearch, kind, settings):
+    """
+    Приводит индекс вида документа к схеме es_schema. Вызывается при каждом старте и ничего не делает,
+    если индекс уже соответствует схеме.
+
+    Если индекса ещё нет, создаётся первая версия со схемой и алиасом. Если живой маппинг расходится
+    со схемой, новые поля дописываются через put_mapping. Несовместимые изменения (другой тип поля,
+    анализаторы) так не применить - для них нужна полная переиндексация reindex.py.
+    :return: список расхождений, оставшихся после применения схемы
+    """
+    alias = INDEX_NAMES[kind]
+    if not es.indices.exists(index=alias):
+        index = versioned_name(alias, 1)
+        es.indices.create(
+            index=index,
+            mappings=es_schema.get_mappings(kind),
+            settings=es_schema.get_settings(settings),
+            aliases={alias: {}},
+        )
+        logging.info('Created index %s with schema version %s', index, es_schema.SCHEMA_VERSION)
+        return []
+
+    expected = es_schema.get_mappings(kind)
+    if not diff_mapping(expected, get_live_mapping(es, kind)):
+        return []
+    try:
+        es.indices.put_mapping(
+            index=alias,
+            properties=expected['properties'],
+            dynamic=expected['dynamic'],
+            meta=expected['_meta'],
+        )
+    except BadRequestError as err:
+        logging.warning('Mapping of %s is incompatible with schema: %s', alias, err)
+    diffs = diff_mapping(expected, get_live_mapping(es, kind))
+    if diffs:
+        logging.warning('Index %s differs from schema version %s in %s, run reindex.py',
+                        alias, es_schema.SCHEMA_VERSION, ', '.join(diffs))
+    return diffs
+
+
+def ensure_indices(es: Elasticsearch, settings):
+    """Применяет схему ко всем индексам ETL. :return: словарь расхождений по видам документов"""
+    return {kind: diffs for kind in INDEX_NAMES if (diffs := ensure_index(es, kind, settings))}
@@ -0,0 +1,114 @@
+import json
+import logging
+import select
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+CHANNEL = 'content_changes'
+
+
+def get_ids(payload, key):
+    """id из уведомления: одно значение под key или список под key + 's'."""
+    if key in payload:
+        return [payload[key]]
+    return payload.get(key + 's', [])
+
+
+class ChangeSet:
+    """
+    Накопленные за окно изменения: id фильмов, персон и жанров, которые нужно переиндексировать.
+    Фильмы изменившихся персон и жанров отдельно не хранятся - их находит PostgresLoader.
+
+    Изменение связи затрагивает только свой фильм и документ персоны (в нём список фильмов),
+    поэтому персоны из связей хранятся отдельно от изменённых строк person и не раскрываются
+    во все их фильмы. Документ жанра от связей не зависит.
+    """
+
+    def __init__(self):
+        self.film_ids = set()
+        self.person_ids = set()
+        self.genre_ids = set()
+        self.linked_person_ids = set()
+
+    def __bool__(self):
+        return bool(self.film_ids or self.person_ids or self.genre_ids or self.linked_person_ids)
+
+    def __len__(self):
+        return len(self.film_ids) + len(self.person_ids) + len(self.genre_ids) + len(self.linked_person_ids)
+
+    def add(self, payload):
+        """
+        Разбирает одно уведомление: строки от триггера notify_content_change ({'id': ...})
+        или пачки массовой загрузки со списками id ({'ids': [...]}, {'film_work_ids': [...]}).
+        """
+        table = payload.get('table')
+        if table == 'film_work':
+            self.film_ids.update(get_ids(payload, 'id'))
+        elif table == 'person':
+            self.person_ids.update(get_ids(payload, 'id'))
+        elif table == 'genre':
+            self.genre_ids.update(get_ids(payload, 'id'))
+        elif table == 'person_film_work':
+            self.film_ids.update(get_ids(payload, 'film_work_id'))
+            self.linked_person_ids.update(get_ids(payload, 'person_id'))
+        elif table == 'genre_film_work':
+            self.film_ids.update(get_ids(payload, 'film_work_id'))
+
+
+class ChangeListener:
+    """
+    Подписка на уведомления об изменениях каталога (LISTEN content_changes).
+
+    Уведомления не обрабатываются по одному: после первого слушатель ждёт ещё debounce секунд
+    тишины (но не дольше max_delay) и отдаёт все накопленные id одной пачкой.
+
+    :param dsl: параметры подключения к Postgres
+    :param debounce: сколько секунд тишины закрывает пачку
+    :param max_delay: максимальная задержка пачки от первого уведомления, сек
+    :param max_batch: максимальное количество id в пачке
+    """
+
+    def __init__(self, dsl: dict, debounce=0.5, max_delay=5.0, max_batch=1000):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.conn = psycopg2.connect(**dsl)
+        self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.conn.cursor() as curs:
+            curs.execute('LISTEN {};'.format(CHANNEL))
+
+    def close(self):
+        self.conn.close()
+
+    def _poll(self, timeout):
+        """Ждёт уведомления не дольше timeout секунд и возвращает полученные."""
+        if not self.conn.notifies and select.select([self.conn], [], [], max(timeout, 0)) != ([], [], []):
+            self.conn.poll()
+        notifies, self.conn.notifies[:] = list(self.conn.notifies), []
+        return notifies
+
+    def wait(self, timeout):
+        """
+        Ждёт изменений не дольше timeout секунд.
+        :return: ChangeSet (пустой, если уведомлений не было)
+        """
+        changes = ChangeSet()
+        notifies = self._poll(timeout)
+        if not notifies:
+            return changes
+        deadline = time.monotonic() + self.max_delay
+        while notifies:
+            for notify in notifies:
+                try:
+                    changes.add(json.loads(notify.payload))
+                except (ValueError, KeyError):
+                    logging.warning('Bad notification payload: %s', notify.payload)
+            if len(changes) >= self.max_batch:
+                break
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            notifies = self._poll(min(self.debounce, left))
+        return changes
@@ -1,11 +1,20 @@
-import uuid
 import datetime
+import logging
+import threading
+import uuid
+from functools import partial
+from typing import NamedTuple
 
 from psycopg2.extensions import connection as _connection
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, NotFoundError
+
+import indices
+from bulk_writer import BulkWriter
 
 from data_queries import *
-from status_check import State
+from fingerprint import DocumentHashes
+from indices import INDEX_NAMES
+from status_check import MemoryStorage, State
 
 from pydantic import BaseModel
 
@@ -29,7 +38,7 @@ class Person(BaseModel):
     """Pydantic model для валидирования конфигурации"""
     id: uuid.UUID
     full_name: str
-    role: str
+    role: list
     film_ids: list
     modified: datetime.datetime | None = None
 
@@ -41,206 +50,384 @@ class Genre(BaseModel):
     modified: datetime.datetime | None = None
 
 
+class MovieRecord(NamedTuple):
+    """Запись фильма без валидации: те же поля, что у Movies, но строится одним вызовом tuple."""
+    id: str
+    title: str
+    description: str
+    rating: float
+    actors: list
+    actors_names: list
+    writers: list
+    writers_names: list
+    director: str
+    genre: list
+    modified: datetime.datetime
+
+
+class PersonRecord(NamedTuple):
+    """Запись персоны без валидации, поля как у Person; role - все роли персоны."""
+    id: str
+    full_name: str
+    role: list
+    film_ids: list
+    modified: datetime.datetime
+
+
+class GenreRecord(NamedTuple):
+    """Запись жанра без валидации, поля как у Genre."""
+    id: str
+    name: str
+    modified: datetime.datetime
+
+
+class DocumentRecord(NamedTuple):
+    """Фильм, чей документ Elasticsearch уже собран в Postgres: JSON-текст без разбора."""
+    id: str
+    document: str
+    modified: datetime.datetime
+
+
+# В строгом режиме каждая запись дополнительно проверяется pydantic-моделью
+STRICT_MODELS = {
+    MovieRecord: Movies,
+    PersonRecord: Person,
+    GenreRecord: Genre,
+}
+
+
+def row_transform(record_class, columns):
+    """Декоратор, помечающий функцию преобразования строки её записью и нужными колонками."""
+    def decorator(func):
+        func.record_class = record_class
+        func.columns = columns
+        return func
+    return decorator
+
+
+@row_transform(MovieRecord, ('id', 'title', 'description', 'rating', 'modified', 'persons', 'genres'))
+def movie_from_row(row):
+    """Строка запроса по фильмам -> MovieRecord, без промежуточных словарей."""
+    actors = []
+    writers = []
+    director = ''
+    for person in row['persons']:
+        role = person['person_role']
+        if role == 'actor':
+            actors.append({'id': person['person_id'], 'name': person['person_name']})
+        elif role == 'scenarist':
+            writers.append({'id': person['person_id'], 'name': person['person_name']})
+        elif role == 'director':
+            director = person['person_name']
+    return MovieRecord(
+        row['id'], row['title'], row['description'], row['rating'],
+        actors, [actor['name'] for actor in actors],
+        writers, [writer['name'] for writer in writers],
+        director, row['genres'], row['modified'],
+    )
+
+
+@row_transform(DocumentRecord, ('id', 'document', 'modified'))
+def document_from_row(row):
+    """Строка запроса готовых документов -> DocumentRecord."""
+    return DocumentRecord(row['id'], row['document'], row['modified'])
+
+
+@row_transform(PersonRecord, ('id', 'full_name', 'roles', 'film_ids', 'modified'))
+def person_from_row(row):
+    """Строка запроса по персонам -> PersonRecord."""
+    return PersonRecord(row['id'], row['full_name'], row['roles'], row['film_ids'], row['modified'])
+
+
+@row_transform(GenreRecord, ('id', 'name', 'modified'))
+def genre_from_row(row):
+    """Строка запроса по жанрам -> GenreRecord."""
+    return GenreRecord(row['id'], row['name'], row['modified'])
+
+
+def check_columns(curs, columns):
+    """Проверяет, что запрос вернул все колонки, нужные преобразованию строк."""
+    missing = set(columns) - {column.name for column in curs.description}
+    if missing:
+        raise ValueError('Query result lacks columns: {}'.format(', '.join(sorted(missing))))
+
+
 class PostgresLoader:
     """
     Класс, отвечающий за соединение с бд Postgresql и сохранение данных для каждой таблицы.
 
     Параметры:
     pg_conn(_connection): соединение с бд
+    itersize(int): сколько строк за раз забирается с серверного курсора
+    strict(bool): проверять каждую запись pydantic-моделью (медленнее, для отладки данных)
+    sql_documents(bool): собирать документы фильмов в Postgres и передавать их в bulk без разбора
+    film_summary(bool): читать персоны и жанры фильмов из сводной таблицы film_work_summary
+    shard(tuple): диапазон id фильмов (нижняя граница, верхняя граница или None) для выгрузки по частям
     """
 
-    def __init__(self, pg_conn: _connection):
+    def __init__(self, pg_conn: _connection, itersize: int = 200, strict: bool = False,
+                 sql_documents: bool = False, film_summary: bool = False):
         self.conn = pg_conn
-        self.curs = self.conn.cursor()
+        self.itersize = itersize
+        self.strict = strict
+        self.sql_documents = sql_documents
+        self.film_summary = film_summary
+        self.shard = None
 
-    def collect_movies(self, stmt, num=200):
+    def server_cursor(self):
         """
-        Функция принимающая запрос. Помещает данные в класс Movies и возвращает генератор с фильмами.
+        Именованный (серверный) курсор: результат запроса остаётся в Postgres и забирается
+        порциями по itersize строк, поэтому память ETL не зависит от размера таблицы.
+        """
+        curs = self.conn.cursor(name='etl_{}'.format(uuid.uuid4().hex))
+        curs.itersize = self.itersize
+        return curs
+
+    def collect(self, stmt, transform, num=None, params=None):
+        """
+        Функция, читающая запрос порциями и превращающая строки в записи.
+        Состав колонок проверяется один раз на запрос, а не на каждую строку.
         :param stmt: запрос для Postgresql
-        :return: Генератор на 200 фильмов.
-        """
-        def get_data_from_row(row):
-            info = {}
-            row = dict(row)
-            actors_names_list = []
-            actors_list = []
-            writers_names_list = []
-            writers_list = []
-            director = ''
-            genres_list = []
-            info['id'] = row['id']
-            info['title'] = row['title']
-            info['description'] = row['description']
-            info['rating'] = row['rating']
-            info['modified'] = row['modified']
-
-            for person in row['persons']:
-                if person['person_role'] == 'actor':
-                    actors_names_list.append(person['person_name'])
-                    actors_list.append({
-                        'id': person['person_id'],
-                        'name': person['person_name']
-                    })
-                elif person['person_role'] == 'writer':
-                    writers_names_list.append(person['person_name'])
-                    writers_list.append({
-                        'id': person['person_id'],
-                        'name': person['person_name']
-                    })
-                elif person['person_role'] == 'director':
-                    director = person['person_name']
-            for genre in row['genres']:
-                genres_list.append(genre)
-            info['genres_list'] = genres_list
-            info['director'] = director
-            info['writers_list'] = writers_list
-            info['writers_names_list'] = writers_names_list
-            info['actors_list'] = actors_list
-            info['actors_names_list'] = actors_names_list
-            return info
-
-        self.curs.execute(stmt)
-        while data := self.curs.fetchmany(num):
-            movies_list = []
-            for row in data:
-                info_data = get_data_from_row(row)
-                row_data = {
-                    'id': info_data.get('id'),
-                    'title': info_data.get('title'),
-                    'description': info_data.get('description'),
-                    'rating': info_data.get('rating'),
-                    'actors': info_data.get('actors_list'),
-                    'actors_names': info_data.get('actors_names_list'),
-                    'writers': info_data.get('writers_list'),
-                    'writers_names': info_data.get('writers_names_list'),
-                    'director': info_data.get('director'),
-                    'genre': info_data.get('genres_list'),
-                    'modified': info_data.get('modified')
-                }
-                movies_list.append(Movies(**row_data))
-            yield movies_list
-
-    def collect_persons(self, stmt, num=200):
-        """
-        Функция принимающая запрос. Помещает данные в класс Movies и возвращает генератор с персонами.
+        :param transform: функция строка -> запись, обёрнутая row_transform (movie_from_row, person_from_row и т.д.)
+        :param params: параметры запроса
+        :return: Генератор пар (записи, отметка (modified, id) последней строки) по itersize строк.
+        """
+        # Готовые документы из Postgres не разбираются, поэтому и не проверяются моделью
+        model = STRICT_MODELS.get(transform.record_class) if self.strict else None
+        with self.server_cursor() as curs:
+            curs.execute(stmt, params)
+            checked = False
+            while data := curs.fetchmany(num or self.itersize):
+                if not checked:
+                    check_columns(curs, transform.columns)
+                    checked = True
+                items = [transform(row) for row in data]
+                if model:
+                    items = [model(**item._asdict()) for item in items]
+                yield items, (data[-1]['modified'], data[-1]['id'])
+
+    def collect_movies(self, stmt, num=None, params=None):
+        """
+        Функция принимающая запрос и возвращающая генератор с фильмами.
         :param stmt: запрос для Postgresql
-        :return: Генератор на 200 персон.
-        """
-        self.curs.execute(stmt)
-        while data := self.curs.fetchmany(num):
-            movies_list = []
-            for row in data:
-                row = dict(row)
-
-                films_list = []
-                id = row['id']
-                full_name = row['full_name']
-                role = row['role']
-                modified = row['modified']
-
-                for film in row['films']:
-                    films_list.append(film['films'])
-
-                row_data = {
-                    'id': id,
-                    'full_name': full_name,
-                    'role': role,
-                    'film_ids': films_list,
-                    'modified': modified
-                }
-                movies_list.append(Person(**row_data))
-            yield movies_list
-
-    def collect_genres(self, stmt, num=200):
-        """
-        Функция, принимающая запрос. Помещает данные в класс Movies и возвращает генератор с жанрами.
+        :param params: параметры запроса
+        :return: Генератор пар (фильмы, отметка (modified, id) последней строки) по itersize фильмов.
+        """
+        return self.collect(stmt, document_from_row if self.sql_documents else movie_from_row, num, params)
+
+    def get_film_query(self, where):
+        """
+        Запрос по фильмам: строки для сборки документа в Python или готовые документы из Postgres,
+        из таблиц связей или из сводной таблицы по film_summary.
+        """
+        if self.sql_documents:
+            if self.film_summary:
+                return get_filmwork_summary_documents_query(where)
+            return get_filmwork_documents_query(where)
+        if self.film_summary:
+            return get_filmwork_summary_query(where)
+        return get_list_update_filmwork_query(where)
+
+    def get_film_by_ids_query(self):
+        """Запрос по фильмам с заданными id в режиме, выбранном sql_documents и film_summary."""
+        if self.sql_documents:
+            if self.film_summary:
+                return get_filmwork_summary_documents_by_ids_query()
+            return get_filmwork_documents_by_ids_query()
+        if self.film_summary:
+            return get_filmwork_summary_by_ids_query()
+        return get_filmwork_by_ids_query()
+
+    def collect_persons(self, stmt, num=None, params=None):
+        """
+        Функция принимающая запрос и возвращающая генератор с персонами.
         :param stmt: запрос для Postgresql
-        :return: Генератор на 200 жанров.
+        :param params: параметры запроса
+        :return: Генератор пар (персоны, отметка последней строки) по itersize персон.
         """
-        self.curs.execute(stmt)
-        while data := self.curs.fetchmany(num):
-            movies_list = []
-            for row in data:
-                row = dict(row)
+        return self.collect(stmt, person_from_row, num, params)
 
-                id = row['id']
-                name = row['name']
-                modified = row['modified']
+    def collect_genres(self, stmt, num=None, params=None):
+        """
+        Функция, принимающая запрос и возвращающая генератор с жанрами.
+        :param stmt: запрос для Postgresql
+        :param params: параметры запроса
+        :return: Генератор пар (жанры, отметка последней строки) по itersize жанров.
+        """
+        return self.collect(stmt, genre_from_row, num, params)
+
+    def get_film_ids(self, stmt, entity_ids):
+        """
+        Функция, возвращающая id фильмов, связанных с переданными персонами или жанрами.
+        :param stmt: запрос к таблице связей
+        :param entity_ids: id персон или жанров
+        :return: список id фильмов
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(stmt, (entity_ids,))
+            return [row['film_work_id'] for row in curs.fetchall()]
 
-                row_data = {
-                    'id': id,
-                    'name': name,
-                    'modified': modified
-                }
-                movies_list.append(Genre(**row_data))
-            yield movies_list
+    def enrich_films(self, changed_stmt, film_ids_stmt, params, num=None):
+        """
+        Стадия обогащения: сначала собираются id изменившихся персон или жанров,
+        затем через таблицы связей находятся id их фильмов, и заново агрегируются
+        только эти фильмы. Объём работы зависит от количества изменений, а не от размера каталога.
+
+        :param changed_stmt: запрос изменившихся сущностей
+        :param film_ids_stmt: запрос id фильмов по id сущностей
+        :param params: параметры запроса изменившихся сущностей
+        :return: Генератор пар (фильмы, отметка). Отметка изменившейся сущности отдаётся
+        только с последней порцией её пачки, до этого - None.
+        """
+        seen_ids = set()
+        num = num or self.itersize
+        with self.server_cursor() as changed_curs:
+            changed_curs.execute(changed_stmt, params)
+            while changed := changed_curs.fetchmany(num):
+                film_ids = [
+                    film_id for film_id in self.get_film_ids(film_ids_stmt, [row['id'] for row in changed])
+                    if film_id not in seen_ids
+                ]
+                seen_ids.update(film_ids)
+                for start in range(0, len(film_ids), num):
+                    for movies_list, _ in self.collect_movies(
+                            self.get_film_by_ids_query(), num, (film_ids[start:start + num],)):
+                        yield movies_list, None
+                yield [], (changed[-1]['modified'], changed[-1]['id'])
+
+    def get_movies_by_ids(self, film_ids):
+        """
+        Функция, собирающая фильмы по списку id.
+        :param film_ids: id фильмов
+        :return: Генератор пар (фильмы, отметка)
+        """
+        return self.collect_movies(self.get_film_by_ids_query(), params=(list(film_ids),))
 
-    def get_list_update_filmwork(self, status):
+    def get_persons_by_ids(self, person_ids):
+        """
+        Функция, собирающая персоны по списку id.
+        :return: Генератор пар (персоны, отметка)
+        """
+        return self.collect_persons(get_persons_by_ids_query(), params=(list(person_ids),))
+
+    def get_genres_by_ids(self, genre_ids):
+        """
+        Функция, собирающая жанры по списку id.
+        :return: Генератор пар (жанры, отметка)
+        """
+        return self.collect_genres(get_genres_by_ids_query(), params=(list(genre_ids),))
+
+    def get_upper_bound(self, table):
+        """
+        Функция, возвращающая отметку (modified, id) последней изменённой строки таблицы.
+        Фиксируется в начале запуска, чтобы каждый поток выгружался до неё и останавливался.
+        :param table: таблица в схеме content
+        :return: (modified, id) или None для пустой таблицы
+        """
+        with self.conn.cursor() as curs:
+            curs.execute(get_upper_bound_query(table))
+            row = curs.fetchone()
+        return (row['modified'], row['id']) if row else None
+
+    @staticmethod
+    def get_range_filter(alias, checkpoint, bound):
+        """
+        Функция, строящая условие WHERE на диапазон (checkpoint, bound] по паре (modified, id).
+        :return: (условие, параметры запроса)
+        """
+        conditions = ["({0}.modified, {0}.id) <= (%s, %s)".format(alias)]
+        params = list(bound)
+        if checkpoint:
+            conditions.insert(0, "({0}.modified, {0}.id) > (%s, %s)".format(alias))
+            params = list(checkpoint) + params
+        return 'WHERE ' + ' AND '.join(conditions), params
+
+    def get_list_update_filmwork(self, status, bound):
         """
             Функция с созданием запроса по фильмам.
-            :param status: Требуется для фильтра даты.
+            :param status: Требуется для отметки потока 'film'.
+            :param bound: верхняя граница запуска
             :return: передача в функцию для дальнейшего сбора данных
                 """
-        date = status.get_state('datetime')
-        fw_modified = "WHERE fw.modified > '{}'".format(date) if date else ''
-        stmt = get_list_update_filmwork_query(fw_modified)
-        return self.collect_movies(stmt)
-
-    def get_list_update_person(self, status):
+        fw_modified, params = self.get_range_filter('fw', status.get_checkpoint('film'), bound)
+        if self.shard:
+            lower, upper = self.shard
+            fw_modified += ' AND fw.id >= %s::uuid'
+            params.append(lower)
+            if upper:
+                fw_modified += ' AND fw.id < %s::uuid'
+                params.append(upper)
+        stmt = self.get_film_query(fw_modified)
+        return self.collect_movies(stmt, params=params)
+
+    def get_list_update_person(self, status, bound):
         """
             Функция с созданием запроса по персонам.
-            :param status: Требуется для фильтра даты.
+            :param status: Требуется для отметки потока 'film_person'.
+            :param bound: верхняя граница запуска
             :return: передача в функцию для дальнейшего сбора данных
                 """
-        date = status.get_state('datetime')
-        p_modified = "WHERE p.modified > '{}'".format(date) if date else ''
-        stmt = get_list_update_person_query(p_modified)
-        return self.collect_movies(stmt)
-
-    def get_list_update_genre(self, status):
+        checkpoint = status.get_checkpoint('film_person')
+        if not checkpoint:
+            # При первой загрузке все фильмы уже выгружаются запросом по фильмам,
+            # поэтому отметка сразу переносится на верхнюю границу
+            return iter([([], bound)])
+        p_modified, params = self.get_range_filter('person', checkpoint, bound)
+        return self.enrich_films(get_changed_persons_query(p_modified), get_film_ids_by_persons_query(), params)
+
+    def get_list_update_genre(self, status, bound):
         """
         Функция с созданием запроса по жанрам.
-        :param status: Требуется для фильтра даты.
+        :param status: Требуется для отметки потока 'film_genre'.
+        :param bound: верхняя граница запуска
         :return: передача в функцию для дальнейшего сбора данных
         """
-        date = status.get_state('datetime')
-        g_modified = "WHERE g.modified > '{}'".format(date) if date else ''
-        stmt = get_list_update_genre_query(g_modified)
-        return self.collect_movies(stmt)
-
-    def get_list_update_persons(self, status):
+        checkpoint = status.get_checkpoint('film_genre')
+        if not checkpoint:
+            # При первой загрузке все фильмы уже выгружаются запросом по фильмам,
+            # поэтому отметка сразу переносится на верхнюю границу
+            return iter([([], bound)])
+        g_modified, params = self.get_range_filter('genre', checkpoint, bound)
+        return self.enrich_films(get_changed_genres_query(g_modified), get_film_ids_by_genres_query(), params)
+
+    def get_list_update_persons(self, status, bound):
         """
             Функция с созданием запроса по person.
-            :param status: Требуется для фильтра даты.
+            :param status: Требуется для отметки потока 'person'.
+            :param bound: верхняя граница запуска
             :return: передача в функцию для дальнейшего сбора данных
                 """
-        date = status.get_state('datetime')
-        person_modified = "WHERE person.modified > '{}'".format(date) if date else ''
+        person_modified, params = self.get_range_filter('person', status.get_checkpoint('person'), bound)
         stmt = get_list_update_persons_query(person_modified)
-        return self.collect_persons(stmt)
+        return self.collect_persons(stmt, params=params)
 
-    def get_list_update_genres(self, status):
+    def get_list_update_genres(self, status, bound):
         """
             Функция с созданием запроса по genre.
-            :param status: Требуется для фильтра даты.
+            :param status: Требуется для отметки потока 'genre'.
+            :param bound: верхняя граница запуска
             :return: передача в функцию для дальнейшего сбора данных
                 """
-        date = status.get_state('datetime')
-        genre_modified = "WHERE genre.modified > '{}'".format(date) if date else ''
+        genre_modified, params = self.get_range_filter('genre', status.get_checkpoint('genre'), bound)
         stmt = get_list_update_genres_query(genre_modified)
-        return self.collect_genres(stmt)
+        return self.collect_genres(stmt, params=params)
 
 
-def prepare_to_elastic_film(movie):
+def prepare_to_elastic_film(movie, index=INDEX_NAMES['film']):
     """
     Функция, возвращающая список с подготовленными данными по одному фильму под формат Elasticsearch.
     :param movie: Фильм.
+    :param index: индекс или алиас, в который пишется документ
     :return:
     """
     single_body_list = []
-    first_line = {'index': {'_index': 'movies', '_id': movie.id}}
+    first_line = {'index': {'_index': index, '_id': movie.id}}
 
     single_body_list.append(first_line)
+    if isinstance(movie, DocumentRecord):
+        # Документ собран в Postgres: сериализатор bulk передаёт строку как есть
+        single_body_list.append(movie.document)
+        return single_body_list
     entry = {
         'actors': movie.actors,
         'actors_names': movie.actors_names,
@@ -257,14 +444,15 @@ def prepare_to_elastic_film(movie):
     return single_body_list
 
 
-def prepare_to_elastic_person(movie):
+def prepare_to_elastic_person(movie, index=INDEX_NAMES['person']):
     """
     Функция, возвращающая список с подготовленными данными по одному фильму под формат Elasticsearch.
     :param movie: Фильм.
+    :param index: индекс или алиас, в который пишется документ
     :return:
     """
     single_body_list = []
-    first_line = {'index': {'_index': 'person', '_id': movie.id}}
+    first_line = {'index': {'_index': index, '_id': movie.id}}
 
     single_body_list.append(first_line)
     entry = {
@@ -277,14 +465,15 @@ def prepare_to_elastic_person(movie):
     return single_body_list
 
 
-def prepare_to_elastic_genre(movie):
+def prepare_to_elastic_genre(movie, index=INDEX_NAMES['genre']):
     """
     Функция, возвращающая список с подготовленными данными по одному фильму под формат Elasticsearch.
     :param movie: Фильм.
+    :param index: индекс или алиас, в который пишется документ
     :return:
     """
     single_body_list = []
-    first_line = {'index': {'_index': 'genre', '_id': movie.id}}
+    first_line = {'index': {'_index': index, '_id': movie.id}}
 
     single_body_list.append(first_line)
     entry = {
@@ -295,62 +484,216 @@ def prepare_to_elastic_genre(movie):
     return single_body_list
 
 
+def prepare_delete(kind, doc_id):
+    """
+    Функция, возвращающая действие удаления документа из индекса.
+    :param kind: вид документа: film, person или genre
+    :param doc_id: id документа
+    """
+    return [{'delete': {'_index': INDEX_NAMES[kind], '_id': doc_id}}, None]
+
+
+PREPARE_FUNCTIONS = {
+    'film': prepare_to_elastic_film,
+    'person': prepare_to_elastic_person,
+    'genre': prepare_to_elastic_genre,
+}
+
+# Поток: (таблица, по которой считается отметка, метод PostgresLoader, вид документа)
+STREAMS = {
+    'film': ('film_work', 'get_list_update_filmwork', 'film'),
+    'film_person': ('person', 'get_list_update_person', 'film'),
+    'film_genre': ('genre', 'get_list_update_genre', 'film'),
+    'person': ('person', 'get_list_update_persons', 'person'),
+    'genre': ('genre', 'get_list_update_genres', 'genre'),
+}
+
+
+def has_changes(checkpoint, bound):
+    """Есть ли в потоке строки между сохранённой отметкой и верхней границей запуска."""
+    if bound is None:
+        return False
+    if checkpoint is None:
+        return True
+    modified, row_id = checkpoint
+    return (bound[0], uuid.UUID(str(bound[1]))) > (datetime.datetime.fromisoformat(modified), uuid.UUID(row_id))
+
+
 class ElasticSearchSaver:
     """Класс, отвечающий за соединение с бд Elasticsearch и сохранение данных для каждой таблицы.
 
         :param connection: Соединение с Elasticsearch
+        :param stop_event: событие остановки; после него новые пачки не читаются, а уже прочитанные дописываются
+        :param hashes: отпечатки записанных документов; неизменившиеся документы в bulk не отправляются
+        :param writer_options: параметры BulkWriter (workers, queue_size, chunk_size, max_chunk_bytes, max_retries)
     """
 
-    def __init__(self, connection: Elasticsearch):
+    def __init__(self, connection: Elasticsearch, stop_event: threading.Event = None,
+                 hashes: DocumentHashes = None, **writer_options):
         self.conn = connection
-        self.last_datetime = None
-
-    def executeFunc(self, name):
-        if hasattr(self, name):
-            return getattr(self, name)
-        return None
-
-    def while_data(self, func_name, postgres_loader, status):
-        body_list_films = 1
-        while body_list_films:
-            if func_name == 'film':
-                data_list = [
-                    postgres_loader.get_list_update_filmwork(status),
-                    postgres_loader.get_list_update_person(status),
-                    postgres_loader.get_list_update_genre(status)
-                ]
-            elif func_name == 'person':
-                data_list = [
-                    postgres_loader.get_list_update_persons(status),
-                ]
-            else:
-                data_list = [
-                    postgres_loader.get_list_update_genres(status),
-                ]
-
-            for query in data_list:
-                for list_movies in query:
-                    body_list_films = []
-                    for movie in list_movies:
-                        if movie.modified and movie.modified.astimezone() > self.last_datetime.astimezone():
-                            self.last_datetime = movie.modified
-                        body_list_films.extend(self.executeFunc("prepare_to_elastic_{}".format(func_name))(movie))
-                    if body_list_films:
-                        self.conn.bulk(body=body_list_films)
+        self.stop_event = stop_event or threading.Event()
+        self.hashes = hashes
+        self.writer_options = writer_options
+
+    def get_index_uuid(self, index):
+        """uuid индекса для сверки отпечатков или None, если отпечатки не ведутся."""
+        if not self.hashes:
+            return None
+        try:
+            return indices.get_index_uuid(self.conn, index)
+        except NotFoundError:
+            return None
+
+    def put(self, writer: BulkWriter, stream, index_uuid, actions, checkpoint=None):
+        """Отбрасывает неизменившиеся документы и ставит пачку в очередь на запись."""
+        on_commit = None
+        if index_uuid:
+            actions, hashes = self.hashes.filter(index_uuid, actions)
+            if hashes:
+                on_commit = partial(self.hashes.remember, hashes)
+        writer.put(stream, actions, checkpoint, on_commit)
+
+    def report_skipped(self):
+        if self.hashes:
+            logging.info('Skipped %s unchanged of %s documents', self.hashes.skipped, self.hashes.checked)
+            self.hashes.reset_counters()
+
+    def run_stream(self, stream, bound, postgres_loader, status, writer, index=None):
+        """
+        Выгружает поток от сохранённой отметки до верхней границы запуска, один раз.
+        :param stream: имя потока из STREAMS
+        :param bound: верхняя граница (modified, id), зафиксированная в начале запуска
+        :param index: индекс для записи; по умолчанию алиас вида документа
+        """
+        _, method, kind = STREAMS[stream]
+        prepare = PREPARE_FUNCTIONS[kind]
+        index = index or INDEX_NAMES[kind]
+        index_uuid = self.get_index_uuid(index)
+        for list_movies, checkpoint in getattr(postgres_loader, method)(status, bound):
+            if self.stop_event.is_set():
+                break
+            body_list_films = [prepare(movie, index) for movie in list_movies]
+            # Отметка сдвигается писателем только после успешной записи пачки
+            self.put(writer, stream, index_uuid, body_list_films, checkpoint)
 
     def save_data(self, postgres_loader: PostgresLoader, status: State):
         """
-        Функция для сохранения методом bulk обработанной информации с Postgresql. Также при успешном выполнении
-        сохраняет состояние в файл status.json.
+        Функция для сохранения методом bulk обработанной информации с Postgresql. Запись идёт через BulkWriter
+        параллельно с чтением; после каждой записанной пачки отметка её потока сохраняется в файл status.json.
 
         :param postgres_loader: Экземпляр класса PostgresLoader
         :param status: Текущие состояние на момент подключения к БД.
+        :return: количество потоков, в которых были изменения
+        """
+        # Номер сброса читается до отметок: если переиндексация перенесёт их во время загрузки,
+        # отметки этой загрузки не перезапишут перенесённые
+        epoch = status.get_epoch()
+        tables = {table for table, _, _ in STREAMS.values()}
+        bounds = {table: postgres_loader.get_upper_bound(table) for table in tables}
+        changed = [
+            stream for stream, (table, _, _) in STREAMS.items()
+            if has_changes(status.get_checkpoint(stream), bounds[table])
+        ]
+        if not changed:
+            logging.info('Nothing changed')
+            return 0
+
+        with BulkWriter(self.conn, status, epoch=epoch, **self.writer_options) as writer:
+            for stream in changed:
+                if self.stop_event.is_set():
+                    break
+                self.run_stream(stream, bounds[STREAMS[stream][0]], postgres_loader, status, writer)
+        self.report_skipped()
+        return len(changed)
+
+    def save_changes(self, postgres_loader: PostgresLoader, changes):
         """
-        self.last_datetime = datetime.datetime(2, 1, 1)  # Мин время
-        func_names = ['film', 'person', 'genre']
+        Переиндексирует только документы из пачки уведомлений. Фильмы изменившихся персон и жанров
+        (например, после переименования) находятся через таблицы связей; для изменённой связи
+        переиндексируются только её фильм и персона. Документы, которых больше нет в Postgres, удаляются из индекса.
+        Отметки потоков не сдвигаются: их по-прежнему двигает save_data.
 
-        for f_name in func_names:
-            self.while_data(f_name, postgres_loader, status)
+        :param postgres_loader: Экземпляр класса PostgresLoader
+        :param changes: ChangeSet с id изменившихся фильмов, персон и жанров
+        """
+        film_ids = set(changes.film_ids)
+        if changes.person_ids:
+            film_ids.update(postgres_loader.get_film_ids(get_film_ids_by_persons_query(), list(changes.person_ids)))
+        if changes.genre_ids:
+            film_ids.update(postgres_loader.get_film_ids(get_film_ids_by_genres_query(), list(changes.genre_ids)))
+
+        targets = (
+            ('film', film_ids, postgres_loader.get_movies_by_ids),
+            ('person', changes.person_ids | changes.linked_person_ids, postgres_loader.get_persons_by_ids),
+            ('genre', changes.genre_ids, postgres_loader.get_genres_by_ids),
+        )
+        with BulkWriter(self.conn, None, **self.writer_options) as writer:
+            for kind, ids, collect in targets:
+                if not ids:
+                    continue
+                prepare = PREPARE_FUNCTIONS[kind]
+                index_uuid = self.get_index_uuid(INDEX_NAMES[kind])
+                found = set()
+                for items, _ in collect(ids):
+                    found.update(str(item.id) for item in items)
+                    self.put(writer, kind, index_uuid, [prepare(item) for item in items])
+                self.put(writer, kind, index_uuid,
+                         [prepare_delete(kind, doc_id) for doc_id in set(map(str, ids)) - found])
+        self.report_skipped()
+
+    def reindex(self, postgres_loader: PostgresLoader, status: State, kinds, settings, keep=2, sharded=None):
+        """
+        Полная переиндексация без простоя: каждый вид документов выгружается целиком в новую версию
+        индекса alias_v{N}, после чего алиас одним запросом переключается на неё.
+        Пока идёт загрузка, читатели и инкрементальная загрузка работают со старой версией.
 
-        if self.last_datetime != datetime.datetime(2, 1, 1):
-            status.set_state('datetime', str(self.last_datetime))
+        :param postgres_loader: Экземпляр класса PostgresLoader
+        :param status: Состояние инкрементальной загрузки; после переключения отметки потоков
+        переносятся на границы, до которых выгружены новые индексы
+        :param kinds: виды документов: film, person, genre
+        :param settings: постоянные настройки индексов
+        :param keep: сколько последних версий индекса хранить для отката
+        :param sharded: ShardedReindex, если фильмы выгружаются по частям в несколько процессов
+        """
+        bounds = {table: postgres_loader.get_upper_bound(table) for table, _, _ in STREAMS.values()}
+        kind_bounds = {kind: bounds for kind in kinds}
+        # Полная выгрузка - это поток вида документа без сохранённой отметки
+        scratch = State(MemoryStorage())
+        new_indices = {}
+        try:
+            with BulkWriter(self.conn, scratch, **self.writer_options) as writer:
+                for kind in kinds:
+                    if kind == 'film' and sharded:
+                        # Фильмы выгружаются после остальных, пулом процессов
+                        new_indices[kind], kind_bounds[kind] = sharded.prepare(self.conn, bounds, settings)
+                        continue
+                    new_indices[kind] = indices.create_version(self.conn, kind, settings)
+                    bound = bounds[STREAMS[kind][0]]
+                    if bound:
+                        self.run_stream(kind, bound, postgres_loader, scratch, writer, new_indices[kind])
+            self.report_skipped()
+            film_bound = kind_bounds.get('film', {}).get(STREAMS['film'][0])
+            if self.stop_event.is_set() or (
+                    sharded and film_bound and not sharded.run(new_indices['film'], film_bound, self.stop_event)):
+                raise InterruptedError('Reindex interrupted')
+        except BaseException:
+            for kind, index in new_indices.items():
+                # Индекс выгрузки по частям остаётся, чтобы продолжить её при следующем запуске
+                if not (kind == 'film' and sharded):
+                    self.conn.indices.delete(index=index, ignore_unavailable=True)
+            raise
+
+        for kind, index in new_indices.items():
+            indices.finish_version(self.conn, index, settings)
+        for kind, index in new_indices.items():
+            indices.swap_alias(self.conn, kind, index)
+            indices.drop_old_versions(self.conn, kind, keep)
+            # Сброс увеличивает номер сброса: загрузка демона, начатая до переключения и писавшая
+            # в старый индекс, не сдвинет отметки поверх перенесённых
+            status.reset_checkpoints({
+                stream: kind_bounds[kind][table]
+                for stream, (table, _, stream_kind) in STREAMS.items()
+                if stream_kind == kind and kind_bounds[kind][table]
+            })
+            if kind == 'film' and sharded:
+                sharded.finish(index)
@@ -0,0 +1,51 @@
+import argparse
+import logging
+import os
+import signal
+
+import psycopg2
+from psycopg2.extras import DictCursor
+from elasticsearch import Elasticsearch
+
+import indices
+from connection import get_dsl, get_es_saver, get_index_settings, get_postgres_loader, handle_stop
+from indices import INDEX_NAMES
+from sharded import ShardedReindex
+from status_check import get_status
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Полная переиндексация в новые версии индексов с переключением алиасов.')
+    parser.add_argument('kinds', nargs='*', help='виды документов: {} (по умолчанию все)'.format(
+        ', '.join(INDEX_NAMES)))
+    parser.add_argument('--keep', type=int, default=2, help='сколько последних версий индекса хранить')
+    parser.add_argument('--rollback', action='store_true', help='вернуть алиасы на предыдущие версии')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='на сколько частей делить фильмы для выгрузки в несколько процессов')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='количество процессов (по умолчанию по числу частей, не больше числа ядер)')
+    args = parser.parse_args()
+    kinds = args.kinds or list(INDEX_NAMES)
+    unknown = set(kinds) - set(INDEX_NAMES)
+    if unknown:
+        parser.error('unknown kinds: {}'.format(', '.join(sorted(unknown))))
+
+    with Elasticsearch(os.environ.get('ELASTIC_PORT')) as es:
+        if args.rollback:
+            for kind in kinds:
+                indices.rollback(es, kind)
+            return
+        status = get_status('status.json')
+        sharded = ShardedReindex(status, args.shards, args.workers) if args.shards > 1 else None
+        with psycopg2.connect(**get_dsl(), cursor_factory=DictCursor) as pg_conn:
+            get_es_saver(es).reindex(
+                get_postgres_loader(pg_conn), status, kinds,
+                get_index_settings(), keep=args.keep, sharded=sharded)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    main()
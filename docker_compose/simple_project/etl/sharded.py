@@ -0,0 +1,177 @@
+import contextlib
+import datetime
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import uuid
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
+import psycopg2
+from psycopg2.extras import DictCursor
+from elasticsearch import Elasticsearch
+
+import connection
+import indices
+from bulk_writer import BulkWriter
+from status_check import State, get_status
+
+UUID_SPACE = 2 ** 128
+
+
+def get_shard_range(shard, shards):
+    """
+    Диапазон id части film_work: пространство UUID делится на shards равных отрезков.
+    Условие по диапазону id идёт по первичному ключу, а случайные uuid4 делятся почти поровну.
+    :return: (нижняя граница включительно, верхняя граница не включительно или None для последней части)
+    """
+    lower = str(uuid.UUID(int=shard * UUID_SPACE // shards))
+    upper = str(uuid.UUID(int=(shard + 1) * UUID_SPACE // shards)) if shard + 1 < shards else None
+    return lower, upper
+
+
+def init_worker(event):
+    """Процесс-исполнитель останавливается по общему событию, а сигналы обрабатывает родитель."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    connection.stop_event = event
+
+
+def run_shard(index, shard, shards, bound, state_path):
+    """
+    Выгружает одну часть фильмов в index на своих соединениях с Postgres и Elasticsearch.
+    Отметка части сохраняется в state_path после каждой записанной пачки.
+    :return: (номер части, выгружена ли часть до конца)
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    status = get_status(state_path)
+    if status.get_state('done'):
+        return shard, True
+    with contextlib.closing(psycopg2.connect(**connection.get_dsl(), cursor_factory=DictCursor)) as pg_conn, pg_conn, \
+            Elasticsearch(os.environ.get('ELASTIC_PORT')) as es:
+        postgres_loader = connection.get_postgres_loader(pg_conn)
+        postgres_loader.shard = get_shard_range(shard, shards)
+        es_saver = connection.get_es_saver(es)
+        with BulkWriter(es, status, **es_saver.writer_options) as writer:
+            es_saver.run_stream('film', bound, postgres_loader, status, writer, index)
+        es_saver.report_skipped()
+        if connection.stop_event.is_set():
+            return shard, False
+    status.set_state('done', True)
+    logging.info('Shard %s/%s of %s is done', shard + 1, shards, index)
+    return shard, True
+
+
+class ShardedReindex:
+    """
+    Полная выгрузка фильмов в несколько процессов: film_work делится по диапазонам id на shards частей,
+    каждая часть читается, преобразуется и пишется в bulk отдельным процессом.
+
+    План выгрузки (индекс, границы запуска, число частей) хранится в состоянии ETL, а отметки частей -
+    в отдельных файлах. Прерванная выгрузка при следующем запуске продолжается в тот же индекс,
+    и заново выгружаются только незавершённые части, каждая со своей отметки.
+
+    :param status: Состояние ETL, в котором хранится план
+    :param shards: количество частей
+    :param workers: количество процессов
+    :param state_dir: каталог файлов с отметками частей
+    """
+
+    PLAN_KEY = 'reindex_film'
+
+    def __init__(self, status: State, shards, workers=None, state_dir='.'):
+        self.status = status
+        self.shards = shards
+        self.workers = workers or min(shards, os.cpu_count() or 1)
+        self.state_dir = state_dir
+
+    def shard_path(self, index, shard):
+        return os.path.join(self.state_dir, '{}.shard{}.json'.format(index, shard))
+
+    def remove_shard_files(self, index, shards):
+        for shard in range(shards):
+            path = self.shard_path(index, shard)
+            for name in (path, '{}.lock'.format(path)):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def abandon(self, es: Elasticsearch, plan):
+        """
+        Удаляет недостроенный индекс прерванной выгрузки и отметки его частей, если продолжить её нельзя:
+        иначе он так и останется лишней версией, которую drop_old_versions считает одной из последних.
+        """
+        index = plan['index']
+        if index in indices.get_alias_indices(es, indices.INDEX_NAMES['film']):
+            return
+        if es.indices.exists(index=index):
+            es.indices.delete(index=index)
+            logging.info('Deleted unfinished index %s', index)
+        self.remove_shard_files(index, plan['shards'])
+
+    def prepare(self, es: Elasticsearch, bounds, settings):
+        """
+        Возвращает индекс и границы запуска: из плана прерванной выгрузки, если её индекс ещё существует
+        и число частей не изменилось, иначе удаляет индекс старого плана, создаёт новую версию и сохраняет план.
+        :param bounds: границы (modified, id) таблиц на начало запуска
+        :return: (индекс, границы таблиц, по которым выгружается индекс)
+        """
+        plan = self.status.get_state(self.PLAN_KEY)
+        if plan and plan['shards'] == self.shards and es.indices.exists(index=plan['index']):
+            logging.info('Resuming sharded reindex into %s', plan['index'])
+            return plan['index'], {
+                table: (datetime.datetime.fromisoformat(bound[0]), bound[1]) if bound else None
+                for table, bound in plan['bounds'].items()
+            }
+        if plan:
+            # Отметки частей привязаны к числу частей: с другим числом выгрузка начинается заново
+            logging.info('Cannot resume reindex into %s (%s shards) with %s shards, starting over',
+                         plan['index'], plan['shards'], self.shards)
+            self.abandon(es, plan)
+        index = indices.create_version(es, 'film', settings)
+        self.status.set_state(self.PLAN_KEY, {
+            'index': index,
+            'shards': self.shards,
+            'bounds': {
+                table: [bound[0].isoformat(), str(bound[1])] if bound else None
+                for table, bound in bounds.items()
+            },
+        })
+        return index, bounds
+
+    def pending(self, index):
+        """Номера частей, которые ещё не выгружены до конца."""
+        return [
+            shard for shard in range(self.shards)
+            if not get_status(self.shard_path(index, shard)).get_state('done')
+        ]
+
+    def run(self, index, bound, stop_event: threading.Event):
+        """
+        Выгружает незавершённые части в пуле процессов.
+        :return: выгружены ли все части
+        """
+        pending = self.pending(index)
+        logging.info('Loading %s of %s shards into %s with %s processes',
+                     len(pending), self.shards, index, self.workers)
+        context = multiprocessing.get_context('spawn')
+        worker_stop = context.Event()
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=init_worker, initargs=(worker_stop,)) as pool:
+            not_done = {
+                pool.submit(run_shard, index, shard, self.shards, bound, self.shard_path(index, shard))
+                for shard in pending
+            }
+            while not_done:
+                done, not_done = wait(not_done, timeout=1, return_when=FIRST_EXCEPTION)
+                if stop_event.is_set() or any(future.exception() for future in done):
+                    # Остальные части дописывают текущую пачку и останавливаются
+                    worker_stop.set()
+                for future in done:
+                    future.result()
+        return not self.pending(index)
+
+    def finish(self, index):
+        """Удаляет план и отметки частей после переключения алиаса."""
+        self.remove_shard_files(index, self.shards)
+        self.status.set_state(self.PLAN_KEY, None)
@@ -1,5 +1,9 @@
 import abc
+import contextlib
+import fcntl
 import json
+import os
+import uuid
 from typing import Any, Optional
 
 
@@ -12,6 +16,10 @@ class BaseStorage(abc.ABC):
     def retrieve_state(self) -> dict:
         """Загрузить состояние локально из постоянного хранилища"""
 
+    def lock(self):
+        """Блокировка на время чтения-изменения-записи состояния; по умолчанию не нужна"""
+        return contextlib.nullcontext()
+
 
 class JsonFileStorage(BaseStorage):
     """Класс для работы с сохранением и загрузкой данных в файл в JSON формате."""
@@ -30,9 +38,38 @@ class JsonFileStorage(BaseStorage):
             return dict()
 
     def save_state(self, state: dict) -> None:
-        with open(self.file_path, 'w') as f:
+        # Пишем во временный файл и подменяем: при падении посреди записи старое состояние не теряется
+        tmp_path = '{}.tmp'.format(self.file_path)
+        with open(tmp_path, 'w') as f:
             data = json.dumps(state)
             f.write(data)
+        os.replace(tmp_path, self.file_path)
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Файл состояния пишут и демон, и reindex.py: без блокировки один из них может
+        перезаписать отметки другого старой копией. Блокируется отдельный файл,
+        потому что сам файл состояния подменяется при каждой записи.
+        """
+        with open('{}.lock'.format(self.file_path), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class MemoryStorage(BaseStorage):
+    """Хранилище в памяти процесса: для разовых загрузок, чьи отметки не нужно сохранять."""
+    def __init__(self):
+        self.state = {}
+
+    def retrieve_state(self) -> dict:
+        return dict(self.state)
+
+    def save_state(self, state: dict) -> None:
+        self.state = dict(state)
 
 
 class State:
@@ -41,6 +78,9 @@ class State:
     Релизовано сохранение состояния в файл.
     """
 
+    # Номер сброса отметок: полная переиндексация увеличивает его, когда переносит отметки на новые индексы
+    EPOCH_KEY = 'checkpoint_epoch'
+
     def __init__(self, storage: BaseStorage):
         self.storage = storage
 
@@ -49,13 +89,60 @@ class State:
         if not key:
             return None
 
-        self.storage.save_state({key: value})
+        with self.storage.lock():
+            state = self.storage.retrieve_state()
+            state[key] = value
+            self.storage.save_state(state)
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу"""
         state = self.storage.retrieve_state()
         return state.get(key)
 
+    def get_epoch(self) -> int:
+        """Номер последнего сброса отметок"""
+        return self.get_state(self.EPOCH_KEY) or 0
+
+    def set_checkpoint(self, stream: str, checkpoint: tuple, epoch: Optional[int] = None) -> bool:
+        """
+        Сохранить отметку потока: пару (modified, id) последней обработанной строки.
+        По паре, а не только по дате, чтобы не терять строки с одинаковым modified.
+        Если передан epoch, а отметки с тех пор сбрасывались (reset_checkpoints), отметка не сохраняется:
+        пачка могла уйти в старую версию индекса, и поток должен перечитать её от сброшенной отметки.
+        :return: сохранена ли отметка
+        """
+        modified, row_id = checkpoint
+        with self.storage.lock():
+            state = self.storage.retrieve_state()
+            if epoch is not None and (state.get(self.EPOCH_KEY) or 0) != epoch:
+                return False
+            state[stream] = [modified.isoformat(), str(row_id)]
+            self.storage.save_state(state)
+        return True
+
+    def reset_checkpoints(self, checkpoints: dict) -> None:
+        """
+        Перенести отметки потоков {поток: (modified, id)} и увеличить номер сброса.
+        Отметки, которые загрузка, начатая до сброса, попытается сохранить позже, будут отброшены.
+        """
+        with self.storage.lock():
+            state = self.storage.retrieve_state()
+            for stream, (modified, row_id) in checkpoints.items():
+                state[stream] = [modified.isoformat(), str(row_id)]
+            state[self.EPOCH_KEY] = (state.get(self.EPOCH_KEY) or 0) + 1
+            self.storage.save_state(state)
+
+    def get_checkpoint(self, stream: str) -> Optional[tuple]:
+        """Получить отметку потока (modified, id) или None, если поток ещё не выгружался"""
+        checkpoint = self.get_state(stream)
+        if checkpoint:
+            return tuple(checkpoint)
+        # Состояние старого формата хранило одну дату на все потоки
+        legacy_datetime = self.get_state('datetime')
+        if legacy_datetime:
+            return legacy_datetime, str(uuid.UUID(int=0))
+        return None
+
 
 def get_status(filepath):
     """Функция, отвечающая за создание состояния и сохраняющая данные в переданный файл.